@@ -0,0 +1,144 @@
+"""
+Client-side load balancing over several HTTP endpoints of one MCP server.
+
+Each call goes to the healthy endpoint with the fewest requests in flight (ties go
+to the one that has served fewest). If an endpoint can't be reached, it is marked
+down and the call fails over to the next one. The MCP tools are read-only, so
+re-sending a call that may have reached a dying worker is safe. Down endpoints
+are re-probed in the background at most every HEALTH_INTERVAL seconds, and an
+`on_down` hook lets the pool restart local workers.
+"""
+import asyncio
+import os
+import sys
+import time
+from dataclasses import dataclass
+
+HEALTH_INTERVAL = float(os.getenv("POOL_HEALTH_INTERVAL", "2"))
+
+@dataclass
+class Endpoint:
+    connection: dict  # MCP connection config for this endpoint
+    outstanding: int = 0
+    served: int = 0
+    failures: int = 0
+    healthy: bool = True
+    checked: float = 0.0
+
+    @property
+    def url(self) -> str:
+        return self.connection["url"]
+
+def unreachable(exc: BaseException) -> BaseException | None:
+    """The transport failure in `exc` or anything it wraps (TaskGroup errors included), else None."""
+    import httpx  # loaded by the MCP client anyway; not needed at start-up
+
+    if isinstance(exc, (httpx.TransportError, ConnectionError)):
+        return exc
+    inner = list(getattr(exc, "exceptions", ())) + [exc.__cause__, exc.__context__]
+    return next((found for e in inner if e is not None and e is not exc and (found := unreachable(e))), None)
+
+class Balancer:
+    def __init__(self, name: str, connections: list[dict], probe, start=None, on_down=None):
+        """
+        `probe(url)` -> bool checks one endpoint; `start()` is awaited before the first
+        call (e.g. to spawn local workers); `on_down(endpoint)` runs when one stops answering.
+        """
+        self.name = name
+        self.endpoints = [Endpoint(c) for c in connections]
+        self._probe = probe
+        self._start = start
+        self._on_down = on_down
+        self._started = start is None
+        self._tasks: set[asyncio.Task] = set()
+        self.stats = {"calls": 0, "failovers": 0}
+
+    def _background(self, coro) -> None:
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _check(self, ep: Endpoint) -> bool:
+        ep.checked = time.monotonic()
+        try:
+            ep.healthy = await self._probe(ep.url)
+        except Exception:
+            ep.healthy = False
+        return ep.healthy
+
+    async def check(self) -> dict[str, bool]:
+        """Probe every endpoint now; returns {url: healthy}."""
+        await asyncio.gather(*(self._check(ep) for ep in self.endpoints))
+        return {ep.url: ep.healthy for ep in self.endpoints}
+
+    async def _pick(self, tried: set[str]) -> Endpoint | None:
+        now = time.monotonic()
+        for ep in self.endpoints:
+            if not ep.healthy and now - ep.checked >= HEALTH_INTERVAL:
+                ep.checked = now
+                self._background(self._check(ep))
+        candidates = [ep for ep in self.endpoints if ep.url not in tried]
+        healthy = [ep for ep in candidates if ep.healthy]
+        if not healthy and candidates:
+            # Everything left is marked down: check again rather than fail on stale state
+            await asyncio.gather(*(self._check(ep) for ep in candidates))
+            healthy = [ep for ep in candidates if ep.healthy]
+        return min(healthy, key=lambda ep: (ep.outstanding, ep.served), default=None)
+
+    async def call(self, fn):
+        """`await fn(connection)` on the least-loaded healthy endpoint, failing over on transport errors."""
+        if not self._started:
+            await self._start()
+            self._started = True
+        self.stats["calls"] += 1
+        tried: set[str] = set()
+        last = None
+        while True:
+            ep = await self._pick(tried)
+            if ep is None:
+                raise RuntimeError(f"no reachable {self.name} endpoint ({len(tried)} tried)") from last
+            ep.outstanding += 1
+            try:
+                result = await fn(ep.connection)
+            except Exception as e:
+                cause = unreachable(e)
+                if cause is None:
+                    raise
+                last = e
+                tried.add(ep.url)
+                ep.failures += 1
+                ep.healthy = False
+                ep.checked = time.monotonic()
+                self.stats["failovers"] += 1
+                print(f"[Balancer] {self.name} endpoint {ep.url} unreachable, failing over: "
+                      f"{type(cause).__name__}: {cause}", file=sys.stderr)
+                if self._on_down is not None:
+                    self._background(self._on_down(ep))
+                continue
+            finally:
+                ep.outstanding -= 1
+            ep.served += 1
+            return result
+
+    def wrap_tools(self, variants: list[list]) -> list:
+        """
+        Route LangChain tools through the balancer. `variants[i]` holds the tools converted
+        for endpoint i (same order); the tools of endpoint 0 are returned, re-pointed.
+        """
+        by_url = {ep.url: {t.name: t.coroutine for t in tools} for ep, tools in zip(self.endpoints, variants)}
+
+        def route(name: str):
+            async def balanced_call(**arguments):
+                return await self.call(lambda conn: by_url[conn["url"]][name](**arguments))
+            return balanced_call
+
+        for tool in variants[0]:
+            tool.coroutine = route(tool.name)
+        return variants[0]
+
+    def report(self) -> None:
+        if not self.stats["calls"]:
+            return
+        spread = ", ".join(f"{ep.url.split('//')[-1].split('/')[0]}={ep.served}" for ep in self.endpoints)
+        print(f"Balancer {self.name}: {self.stats['calls']} calls ({spread}), "
+              f"{self.stats['failovers']} failover(s)", file=sys.stderr)
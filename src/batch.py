@@ -0,0 +1,78 @@
+"""
+Batch/JSONL runner for the chatbot client.
+
+Input lines are either JSON objects ({"id": ..., "prompt": ...}; "message"/"text"
+are accepted for the prompt too) or plain text, one prompt per line. Each prompt
+produces one JSON line: {"id", "prompt", "answer", "route", "timings", ...}.
+"""
+import asyncio
+import json
+import sys
+import time
+from typing import Awaitable, Callable, Iterable, TextIO
+
+def read_prompts(lines: Iterable[str]) -> list[dict]:
+    """Parse JSONL (or plain text) lines into [{"id", "prompt"}], skipping blanks."""
+    prompts = []
+    for n, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            obj = json.loads(line)
+        except json.JSONDecodeError:
+            obj = line
+        if isinstance(obj, dict):
+            prompt = obj.get("prompt") or obj.get("message") or obj.get("text") or ""
+            pid = obj.get("id", n)
+        else:
+            prompt, pid = str(obj), n
+        prompts.append({"id": pid, "prompt": prompt})
+    return prompts
+
+async def run_batch(
+    prompts: list[dict],
+    answer: Callable[[str], Awaitable[dict]],
+    out: TextIO = sys.stdout,
+    concurrency: int = 4,
+    ordered: bool = False,
+) -> list[dict]:
+    """
+    Answer `prompts` with at most `concurrency` in flight, writing one JSON line per
+    prompt as soon as it can be emitted: in completion order by default, or in input
+    order with `ordered=True` (finished results are held until earlier ones are written).
+    """
+    sem = asyncio.Semaphore(max(1, concurrency))
+    batch_start = time.perf_counter()
+
+    async def one(idx: int, item: dict) -> tuple[int, dict]:
+        async with sem:
+            queued = time.perf_counter() - batch_start
+            try:
+                res = await answer(item["prompt"])
+            except Exception as e:
+                res = {"answer": None, "route": "error", "error": str(e), "timings": {}}
+        row = {"id": item["id"], "prompt": item["prompt"], **res}
+        row["timings"] = {"queued": round(queued, 3), **(res.get("timings") or {})}
+        return idx, row
+
+    def emit(row: dict) -> None:
+        out.write(json.dumps(row, ensure_ascii=False) + "\n")
+        out.flush()
+
+    rows: list[dict | None] = [None] * len(prompts)
+    next_idx = 0
+    for fut in asyncio.as_completed([one(i, p) for i, p in enumerate(prompts)]):
+        idx, row = await fut
+        rows[idx] = row
+        if not ordered:
+            emit(row)
+            continue
+        while next_idx < len(rows) and rows[next_idx] is not None:
+            emit(rows[next_idx])
+            next_idx += 1
+
+    elapsed = time.perf_counter() - batch_start
+    print(f"Batch: {len(prompts)} prompt(s) in {elapsed:.2f}s "
+          f"({len(prompts) / elapsed if elapsed else 0:.2f}/s, concurrency={concurrency})", file=sys.stderr)
+    return rows
@@ -0,0 +1,270 @@
+"""
+Offline benchmark for the client pipeline and the three MCP servers.
+
+Runs client._answer end to end against deterministic local fakes (see fakes.py):
+a scripted chat model instead of Groq, fixture pages instead of DDGS + the web,
+and a WeatherAPI mock. The real MCP servers run as streamable-http processes on
+free ports with an isolated cache directory, so runs don't touch ~/.cache.
+
+    python src/bench.py                       # all workloads
+    python src/bench.py -w search -n 40 -c 8
+    python src/bench.py --save-baseline base.json
+    python src/bench.py --baseline base.json  # exit 1 on a regression
+    python src/bench.py -w search -c 16 --workers 1 2 4   # throughput vs worker processes
+
+With --workers, each server runs as N worker processes and tool calls are spread over
+them by the same least-outstanding-requests balancer the client uses with the pool.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parent
+SERVER_NAMES = ("math", "weather", "search")
+START_TIMEOUT = 30.0
+
+_TOPICS = ["python asyncio", "rust borrow checker", "vector databases", "transformer models",
+           "kubernetes operators", "webassembly", "sqlite internals", "http/3"]
+_CITIES = ["Paris", "London", "Tokyo", "San Francisco", "Nairobi", "Lima", "Oslo", "Mumbai"]
+WORKLOADS = {
+    # Fast-path arithmetic plus function-style expressions that go through the agent and `evaluate`
+    "math": [
+        lambda r: f"what's ({r.randint(1, 99)} + {r.randint(1, 99)}) x {r.randint(2, 30)}?",
+        lambda r: f"compute {r.randint(2, 9)}^{r.randint(5, 40)} - 1",
+        lambda r: f"calculate sqrt({r.randint(2, 400)}) + factorial({r.randint(3, 12)})",
+        lambda r: f"evaluate log({r.randint(10, 10000)}, 10) * {r.randint(2, 9)}",
+        lambda r: f"calculate nCr({r.randint(20, 60)}, {r.randint(2, 6)}) / {r.randint(2, 9)}",
+    ],
+    # Forced web search: DDGS stand-in + fixture pages (normal, large, slow, non-HTML) + summarize
+    "search": [
+        lambda r: f"Search the web for latest news on {r.choice(_TOPICS)}",
+        lambda r: f"history of {r.choice(_TOPICS)}",
+        lambda r: f"top 5 tutorials for {r.choice(_TOPICS)}",
+        lambda r: f"compare {r.choice(_TOPICS)} vs {r.choice(_TOPICS)}",
+    ],
+    "weather": [
+        lambda r: f"What's the weather in {r.choice(_CITIES)}?",
+        lambda r: f"temperature in {r.choice(_CITIES)} and {r.choice(_CITIES)}",
+        lambda r: f"Is it raining in {r.choice(_CITIES)}? Check the weather conditions",
+    ],
+}
+WORKLOADS["mixed"] = [t for name in ("math", "search", "weather") for t in WORKLOADS[name]]
+
+def prompts_for(workload: str, n: int, seed: int = 0) -> list[dict]:
+    """`n` deterministic prompts for `workload`, cycling through its templates."""
+    rng = random.Random(f"{workload}:{seed}")
+    templates = WORKLOADS[workload]
+    return [{"id": i, "prompt": templates[i % len(templates)](rng)} for i in range(n)]
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+async def _wait_port(port: int, proc: subprocess.Popen, log: Path) -> None:
+    deadline = time.monotonic() + START_TIMEOUT
+    while True:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            if proc.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError(f"bench server on port {port} did not start (see {log})")
+            await asyncio.sleep(0.1)
+
+@contextlib.asynccontextmanager
+async def bench_servers(workdir: Path, fixture_url: str, workers: int = 1):
+    """Start `workers` processes of each MCP server against the fakes; yields {name: [connection, ...]}."""
+    from servers import tracing
+
+    # A fresh server-side cache per worker count, so later runs don't start warm
+    env = {**os.environ, "BENCH_FIXTURE_URL": fixture_url, "MCP_CACHE_DIR": str(workdir / f"cache-{workers}w")}
+    procs, connections = [], {}
+    try:
+        for name in SERVER_NAMES:
+            log = workdir / f"{name}.log"
+            started = []
+            for _ in range(workers):
+                port = _free_port()
+                proc = subprocess.Popen(
+                    [sys.executable, str(SRC_DIR / "fakes.py"), "serve", name, "--port", str(port)],
+                    stdin=subprocess.DEVNULL, stdout=open(log, "ab"), stderr=subprocess.STDOUT, env=env,
+                    cwd=str(SRC_DIR / "servers"),
+                )
+                procs.append(proc)
+                started.append((port, proc))
+            for port, proc in started:
+                await _wait_port(port, proc, log)
+            connections[name] = [{"url": f"http://127.0.0.1:{port}/mcp", "transport": "streamable_http",
+                                  "httpx_client_factory": tracing.http_client_factory} for port, _ in started]
+        yield connections
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            with contextlib.suppress(subprocess.TimeoutExpired):
+                proc.wait(timeout=5)
+
+async def _load_tools(connections: dict) -> tuple[list, dict]:
+    """LangChain tools balanced over each server's workers, and {name: Balancer}."""
+    from langchain_mcp_adapters.sessions import create_session
+    from langchain_mcp_adapters.tools import _list_all_tools
+    from balancer import Balancer
+    import pool
+
+    tools, balancers = [], {}
+    for name, conns in connections.items():
+        async with create_session(conns[0]) as session:
+            await session.initialize()
+            listed = await _list_all_tools(session)
+        balancers[name] = Balancer(name, conns, pool.probe)
+        tools += pool.balanced_tools(balancers[name], listed)
+    return tools, balancers
+
+def summarize_rows(rows: list[dict], elapsed: float, server_spans: list[dict]) -> dict:
+    from servers.tracing import percentiles
+
+    totals = [r["timings"]["total"] for r in rows if r.get("timings", {}).get("total") is not None]
+    stages: dict[str, list[float]] = {}
+    for r in rows:
+        for k, v in (r.get("timings") or {}).items():
+            if k not in ("total", "queued") and v is not None:
+                stages.setdefault(k, []).append(v)
+    server: dict[str, list[float]] = {}
+    for s in server_spans:
+        server.setdefault(f"{s['service']}:{s['name']}", []).append(s["dur"])
+    return {
+        "n": len(rows),
+        "elapsed_s": round(elapsed, 3),
+        "throughput": round(len(rows) / elapsed, 3) if elapsed else 0.0,
+        "latency": {k: round(v, 4) for k, v in percentiles(totals).items()},
+        "stages": {k: {q: round(v, 4) for q, v in percentiles(vals).items()} for k, vals in sorted(stages.items())},
+        "server": {k: {q: round(v, 4) for q, v in percentiles(vals).items()} for k, vals in sorted(server.items())},
+        "routes": dict(Counter(r.get("route") for r in rows)),
+        "errors": sum(1 for r in rows if r.get("route") == "error"),
+    }
+
+async def run_workload(rt, workload: str, n: int, concurrency: int, log) -> dict:
+    import client
+    from batch import run_batch
+    from servers import tracing
+
+    prompts = prompts_for(workload, n)
+    started = time.time()
+    t = time.perf_counter()
+    with contextlib.redirect_stderr(log):
+        rows = await run_batch(prompts, lambda msg: client._answer(rt, msg), io.StringIO(), concurrency=concurrency)
+    elapsed = time.perf_counter() - t
+    await asyncio.sleep(0.2)  # let the servers flush their last spans
+    spans = [s for s in tracing.load(tracing.TRACE_FILE)
+             if s.get("service") in SERVER_NAMES and s.get("start", 0) >= started]
+    return summarize_rows(rows, elapsed, spans)
+
+def print_result(workload: str, res: dict) -> None:
+    lat = res["latency"]
+    print(f"== {workload}: {res['n']} prompts in {res['elapsed_s']:.2f}s, {res['throughput']:.2f}/s, "
+          f"{res['errors']} error(s) ==")
+    print(f"  latency  p50 {lat['p50']:.3f}s  p95 {lat['p95']:.3f}s  p99 {lat['p99']:.3f}s")
+    print("  routes   " + ", ".join(f"{k}={v}" for k, v in sorted(res["routes"].items(), key=str)))
+    for title, table in (("client stage", res["stages"]), ("server span", res["server"])):
+        for name, p in sorted(table.items(), key=lambda kv: -kv[1]["p95"]):
+            print(f"  {title:<13}{name:<28} p50 {p['p50']:.3f}s  p95 {p['p95']:.3f}s  p99 {p['p99']:.3f}s")
+
+def compare(results: dict, baseline: dict, threshold: float) -> bool:
+    """Print changes vs `baseline`; True if throughput or p95/p99 latency regressed by more than `threshold`."""
+    regressed = False
+    print(f"== vs baseline (threshold {threshold:.0%}) ==")
+    for workload, cur in results.items():
+        base = baseline.get(workload)
+        if not base:
+            print(f"  {workload}: no baseline")
+            continue
+        checks = [("throughput", cur["throughput"], base["throughput"], True)]
+        checks += [(q, cur["latency"][q], base["latency"][q], False) for q in ("p50", "p95", "p99")]
+        parts = []
+        for label, now, was, higher_is_better in checks:
+            change = (now - was) / was if was else 0.0
+            bad = (-change if higher_is_better else change) > threshold and label != "p50"
+            regressed |= bad
+            parts.append(f"{label} {was:.3f}->{now:.3f} ({change:+.0%}){' REGRESSION' if bad else ''}")
+        print(f"  {workload}: " + ", ".join(parts))
+    return regressed
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmark with local stand-ins for Groq, DDGS and WeatherAPI")
+    parser.add_argument("-w", "--workload", choices=[*WORKLOADS, "all"], default="all")
+    parser.add_argument("-n", "--prompts", type=int, default=30, help="Prompts per workload (default 30)")
+    parser.add_argument("-c", "--concurrency", type=int, default=4)
+    parser.add_argument("--llm-latency", type=float, default=0.25, help="Scripted model time to first token (s)")
+    parser.add_argument("--llm-per-token", type=float, default=0.005, help="Scripted model seconds per token")
+    parser.add_argument("--leak-every", type=int, default=5, help="Emit every Nth tool call as leaked markup (0 = never)")
+    parser.add_argument("--json", metavar="FILE", help="Write results as JSON")
+    parser.add_argument("--save-baseline", metavar="FILE", help="Save results as the new baseline")
+    parser.add_argument("--baseline", metavar="FILE", help="Compare against a saved baseline")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed regression vs baseline (default 10%%)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1], metavar="N",
+                        help="Worker processes per server; several values run the workloads once per count")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="mcp-bench-"))
+    # Set before the client/server modules are imported: they read these at import time
+    os.environ["MCP_CACHE_DIR"] = str(workdir / "cache")
+    os.environ["MCP_TRACE_FILE"] = str(workdir / "traces.jsonl")
+    sys.path.insert(0, str(SRC_DIR))
+    import client
+    from fakes import FixtureServer, scripted_chat_model
+
+    def make_model(scheduler, cache, callbacks):
+        return scripted_chat_model(latency=args.llm_latency, per_token=args.llm_per_token,
+                                   leak_every=args.leak_every, cache=cache, callbacks=callbacks)
+
+    workloads = list(WORKLOADS) if args.workload == "all" else [args.workload]
+    results = {}
+    with FixtureServer() as fixtures, open(workdir / "client.log", "w") as log:
+        for workers in args.workers:
+            async with bench_servers(workdir, fixtures.url, workers) as connections:
+                tools, balancers = await _load_tools(connections)
+                with contextlib.redirect_stderr(log):
+                    rt = client.build_runtime(tools, {n: c[0] for n, c in connections.items()}, make_model,
+                                              use_pool=False, use_llm_cache=False, balancers=balancers)
+                for workload in workloads:
+                    key = workload if len(args.workers) == 1 else f"{workload}@{workers}w"
+                    results[key] = await run_workload(rt, workload, args.prompts, args.concurrency, log)
+                    print_result(key, results[key])
+                with contextlib.redirect_stderr(log):
+                    for balancer in balancers.values():
+                        balancer.report()
+    if len(args.workers) > 1:
+        print("== throughput by workers per server ==")
+        for workload in workloads:
+            base = results[f"{workload}@{args.workers[0]}w"]["throughput"]
+            print(f"  {workload}: " + ", ".join(
+                f"{w}w {results[f'{workload}@{w}w']['throughput']:.2f}/s "
+                f"(x{results[f'{workload}@{w}w']['throughput'] / base if base else 0:.2f})" for w in args.workers))
+    print(f"(logs and traces in {workdir})")
+
+    meta = {"prompts": args.prompts, "concurrency": args.concurrency, "llm_latency": args.llm_latency,
+            "llm_per_token": args.llm_per_token, "leak_every": args.leak_every, "workers": args.workers}
+    for path in filter(None, (args.json, args.save_baseline)):
+        Path(path).write_text(json.dumps({"meta": meta, "results": results}, indent=2))
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        if baseline.get("meta") != meta:
+            print(f"Note: baseline settings differ: {baseline.get('meta')}")
+        return 1 if compare(results, baseline.get("results", {}), args.threshold) else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
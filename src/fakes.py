@@ -0,0 +1,289 @@
+"""
+Deterministic local stand-ins for Groq, DDGS and WeatherAPI, used by the benchmark.
+
+- ScriptedChatModel: a LangChain chat model that picks tools by keyword, answers from
+  tool output, summarizes snippets, and simulates time to first token and per-token
+  latency. Every `leak_every`-th tool call is emitted as leaked `<function=...>` markup.
+- FixtureServer: a local HTTP server with fixture pages for MarkItDown (normal, large,
+  slow, non-HTML, and mirrors of other pages) and a WeatherAPI-compatible `/v1/current.json`.
+- `python src/fakes.py serve search|weather|math --port P`: runs a real MCP server
+  with DDGS (search) or the WeatherAPI URL (weather) pointed at the fixture server
+  given in BENCH_FIXTURE_URL.
+"""
+import asyncio
+import functools
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, quote_plus, urlparse
+
+SERVERS_DIR = Path(__file__).resolve().parent / "servers"
+
+# Simulated provider latencies (seconds)
+DDGS_DELAY = float(os.getenv("BENCH_DDGS_DELAY", "0.15"))
+WEATHER_DELAY = float(os.getenv("BENCH_WEATHER_DELAY", "0.05"))
+SLOW_PAGE_DELAY = float(os.getenv("BENCH_SLOW_PAGE_DELAY", "1.0"))
+LARGE_PAGE_BYTES = 4 * 1024 * 1024
+# Page kinds cycle by page number, so every query's result list mixes them
+PAGE_KINDS = ("normal", "normal", "large", "normal", "slow", "binary")
+
+_WORDS = (
+    "system model data release version performance update research team language project support "
+    "library feature network memory latency design source community benchmark training paper "
+    "history tutorial guide example result analysis method approach framework platform"
+).split()
+
+# --- fixture pages + WeatherAPI mock ----------------------------------------
+
+def _seed(*parts) -> int:
+    return zlib.crc32("|".join(map(str, parts)).encode())
+
+@functools.lru_cache(maxsize=16)
+def page_html(n: int, query: str, target_bytes: int = 20_000) -> bytes:
+    """Deterministic HTML; about a third of the paragraphs mention the query terms."""
+    rng = random.Random(_seed(n, query))
+    terms = re.findall(r"\w+", query.lower()) or ["topic"]
+    paras, size = [], 0
+    while size < target_bytes:
+        words = rng.choices(_WORDS, k=rng.randint(40, 90))
+        if rng.random() < 0.35:
+            for _ in range(rng.randint(1, 4)):
+                words.insert(rng.randrange(len(words)), rng.choice(terms))
+        p = f"<p>{' '.join(words).capitalize()}. See <a href='/page/{n + 1}'>more</a>.</p>"
+        paras.append(p)
+        size += len(p)
+    return (f"<html><head><title>Page {n}</title></head><body><nav>Home | Docs | Blog</nav>"
+            f"<h1>Page {n} about {query}</h1>{''.join(paras)}<footer>Fixture</footer></body></html>").encode()
+
+def weather_json(q: str) -> dict:
+    rng = random.Random(_seed("weather", q.lower()))
+    name = q.split(",")[0].strip().title() or "Nowhere"
+    return {
+        "location": {"name": name, "region": "Fixture Region", "country": "Fixtureland"},
+        "current": {
+            "temp_c": round(rng.uniform(-5, 35), 1), "feelslike_c": round(rng.uniform(-8, 38), 1),
+            "humidity": rng.randint(10, 95), "wind_kph": round(rng.uniform(0, 40), 1),
+            "wind_dir": rng.choice(["N", "NE", "E", "SE", "S", "SW", "W", "NW"]),
+            "condition": {"text": rng.choice(["Sunny", "Partly cloudy", "Overcast", "Light rain"])},
+        },
+    }
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, ctype: str, body: bytes, chunk_delay: float = 0.0):
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            if not chunk_delay:
+                self.wfile.write(body)
+                return
+            # Trickle the body out so the client sees a slow server, not just a slow start
+            step = max(1, len(body) // 10)
+            for i in range(0, len(body), step):
+                self.wfile.write(body[i:i + step])
+                self.wfile.flush()
+                time.sleep(chunk_delay / 10)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client hit its byte cap or deadline and hung up
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        qs = {k: v[0] for k, v in parse_qs(url.query).items()}
+        m = re.fullmatch(r"/(page|mirror)/(\d+)", url.path)
+        if m:
+            n = int(m.group(2))
+            kind = PAGE_KINDS[n % len(PAGE_KINDS)] if m.group(1) == "page" else "normal"
+            query = qs.get("q", "")
+            if kind == "binary":
+                return self._send(200, "application/pdf", b"%PDF-1.4\n" + os.urandom(32 * 1024))
+            if kind == "large":
+                return self._send(200, "text/html; charset=utf-8", page_html(n, query, LARGE_PAGE_BYTES))
+            if kind == "slow":
+                return self._send(200, "text/html; charset=utf-8", page_html(n, query), SLOW_PAGE_DELAY)
+            return self._send(200, "text/html; charset=utf-8", page_html(n, query))
+        if url.path == "/v1/current.json":
+            time.sleep(WEATHER_DELAY)
+            if not qs.get("key"):
+                return self._send(401, "application/json", json.dumps({"error": {"message": "API key missing"}}).encode())
+            q = qs.get("q", "")
+            # Like WeatherAPI, reject queries that aren't a place name, so parsing bugs show up in the bench
+            if not q.strip() or re.search(r"[?!]", q) or len(q.split()) > 5:
+                return self._send(400, "application/json",
+                                  json.dumps({"error": {"code": 1006, "message": "No matching location found."}}).encode())
+            return self._send(200, "application/json", json.dumps(weather_json(q)).encode())
+        self._send(404, "text/plain", b"not found")
+
+class FixtureServer:
+    """Fixture pages and the WeatherAPI mock on 127.0.0.1, served from a background thread."""
+
+    def __init__(self, port: int = 0):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def fake_ddgs_results(query: str, mr: int) -> list[tuple[str, str]]:
+    """Stand-in for search._ddgs_results: 2*mr ranked (title, url) pairs on the fixture server."""
+    time.sleep(DDGS_DELAY)
+    base = os.environ["BENCH_FIXTURE_URL"]
+    start = _seed(query.lower()) % 997
+    q = quote_plus(query)
+    results = []
+    for i in range(mr * 2):
+        # Like real result lists, some entries repeat an earlier page: a tracking-param
+        # variant of the same URL, or a mirror serving the same text under another path
+        if i % 5 == 3:
+            url = f"{base}/page/{start + i - 1}?q={q}&utm_source=feed"
+        elif i % 5 == 4:
+            url = f"{base}/mirror/{start + i - 4}?q={q}"
+        else:
+            url = f"{base}/page/{start + i}?q={q}"
+        results.append((f"Result {i + 1} for {query}", url))
+    return results
+
+# --- scripted chat model ----------------------------------------------------
+
+def scripted_chat_model(latency: float = 0.25, per_token: float = 0.005, leak_every: int = 0, **kwargs):
+    """Build a ScriptedChatModel (LangChain is imported lazily, like in the client)."""
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, SystemMessage, ToolMessage
+    from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+    weather_re = re.compile(r"\b(weather|temperature|forecast|humidity|wind)\b", re.I)
+    math_re = re.compile(r"\b(sqrt|factorial|log|sin|cos|tan|nCr|nPr|power)\s*\(|\d\s*[-+*/^x×]\s*\d", re.I)
+
+    class ScriptedChatModel(BaseChatModel):
+        latency: float = 0.25
+        per_token: float = 0.005
+        leak_every: int = 0
+        tool_calls: int = 0
+
+        @property
+        def _llm_type(self) -> str:
+            return "scripted"
+
+        def bind_tools(self, tools, **kwargs):
+            return self
+
+        def _tool_call(self, name: str, args: dict) -> AIMessage:
+            self.tool_calls += 1
+            if self.leak_every and self.tool_calls % self.leak_every == 0:
+                return AIMessage(content=f"<function={name}>{json.dumps(args)}</function>")
+            call_id = "call_" + hashlib.sha1(f"{name}{args}{self.tool_calls}".encode()).hexdigest()[:12]
+            return AIMessage(content="", tool_calls=[{"name": name, "args": args, "id": call_id}])
+
+        def respond(self, messages) -> AIMessage:
+            system = messages[0].content if isinstance(messages[0], SystemMessage) else ""
+            last = messages[-1]
+            if "concise summarizer" in system:
+                snippets = str(last.content).split("Snippets:", 1)[-1]
+                words = re.findall(r"[A-Za-z][\w'-]*", snippets)[:60]
+                return AIMessage(content="Summary: " + " ".join(words) + ".")
+            if "running summary of a conversation" in system:
+                words = re.findall(r"[A-Za-z0-9][\w'-]*", str(last.content).split("New turns:", 1)[-1])[:80]
+                return AIMessage(content="Earlier: " + " ".join(words) + ".")
+            if "Rewrite the assistant's last message" in system:
+                return AIMessage(content=re.sub(r"</?function[^>]*>", "", str(last.content)).strip())
+            if isinstance(last, ToolMessage):
+                results = []
+                for m in reversed(messages):
+                    if not isinstance(m, ToolMessage):
+                        break
+                    results.insert(0, str(m.content))
+                return AIMessage(content="Based on the tools: " + " | ".join(r[:300] for r in results))
+            user = next((str(m.content) for m in reversed(messages) if isinstance(m, HumanMessage)), "")
+            if weather_re.search(user):
+                loc = re.split(r"\b(?:in|for|at)\s+", user, flags=re.I)[-1].strip(" ?.!") or user
+                return self._tool_call("get_weather", {"location": loc})
+            if math_re.search(user):
+                expr = re.sub(r"^(what('s| is)|compute|calculate|evaluate|work out)\s+", "", user.strip(), flags=re.I)
+                expr = expr.rstrip("?.! ").replace("^", "**").replace("×", "*")
+                return self._tool_call("evaluate", {"expression": expr})
+            return self._tool_call("web_search", {"query": user, "max_results": 3})
+
+        def _delay(self, msg: AIMessage) -> float:
+            return self.latency + self.per_token * len(str(msg.content).split())
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+            msg = self.respond(messages)
+            time.sleep(self._delay(msg))
+            return ChatResult(generations=[ChatGeneration(message=msg)])
+
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+            msg = self.respond(messages)
+            await asyncio.sleep(self._delay(msg))
+            return ChatResult(generations=[ChatGeneration(message=msg)])
+
+        async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+            msg = self.respond(messages)
+            await asyncio.sleep(self.latency)
+            if msg.tool_calls:
+                chunks = [{"name": c["name"], "args": json.dumps(c["args"]), "id": c["id"], "index": i}
+                          for i, c in enumerate(msg.tool_calls)]
+                yield ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=chunks))
+                return
+            for token in re.findall(r"\S+\s*", str(msg.content)):
+                await asyncio.sleep(self.per_token)
+                yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    return ScriptedChatModel(latency=latency, per_token=per_token, leak_every=leak_every, **kwargs)
+
+# --- MCP servers wired to the fakes -----------------------------------------
+
+def serve(name: str, port: int) -> None:
+    """Run one of the real MCP servers over streamable-http, with its provider swapped for a fake."""
+    sys.path.insert(0, str(SERVERS_DIR))
+    if name == "search":
+        import search as module
+        module._ddgs_results = fake_ddgs_results
+    elif name == "weather":
+        import weather as module
+        module.WEATHER_URL = os.environ["BENCH_FIXTURE_URL"] + "/v1/current.json"
+        os.environ.setdefault("WEATHER_API_KEY", "bench")
+    elif name == "math":
+        import mathserver as module
+    else:
+        raise SystemExit(f"unknown server {name!r}")
+    module.mcp.settings.port = port
+    module.mcp.run(transport="streamable-http")
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark stand-ins")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("serve", help="Run an MCP server against the fakes")
+    p.add_argument("server", choices=["search", "weather", "math"])
+    p.add_argument("--port", type=int, required=True)
+    p = sub.add_parser("fixtures", help="Serve fixture pages and the WeatherAPI mock until interrupted")
+    p.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+
+    if args.cmd == "serve":
+        serve(args.server, args.port)
+    else:
+        with FixtureServer(args.port) as fx:
+            print(f"Fixtures at {fx.url}")
+            threading.Event().wait()
@@ -0,0 +1,115 @@
+"""
+Exact-match cache for chat model calls, backed by the SQLite TTL/LRU cache.
+
+Plugs into LangChain's cache hook (`ChatGroq(..., cache=llm_cache)`), so the agent,
+summarize and reformat calls are cached transparently. The key is a hash of the
+model's llm_string (model name, parameters and bound tools) and the normalized
+message list. Use `bypass()` around calls whose answer must be fresh.
+"""
+import contextlib
+import contextvars
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+
+from langchain_core.caches import BaseCache
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, Generation
+
+from servers.cache import SQLiteCache
+
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(24 * 60 * 60)))
+# Keys that differ between identical requests (run ids, token counts, ...) and are left out of the key
+_VOLATILE = {"id", "response_metadata", "usage_metadata", "run_id"}
+
+# Streamed and non-streamed calls return the same generations, so `stream` is left out of the key
+_STREAM_PARAM = re.compile(r"(, )?\('stream', (True|False)\)")
+
+_bypass = contextvars.ContextVar("llm_cache_bypass", default=False)
+
+def _normalize(obj):
+    if isinstance(obj, dict):
+        return {k: _normalize(v) for k, v in obj.items() if k not in _VOLATILE}
+    if isinstance(obj, list):
+        return [_normalize(v) for v in obj]
+    if isinstance(obj, str):
+        return re.sub(r"\s+", " ", obj).strip()
+    return obj
+
+class SQLiteLLMCache(BaseCache):
+    """LangChain cache storing chat generations in a SQLiteCache table, with hit/saved-latency counters."""
+
+    def __init__(self, ttl: float = LLM_CACHE_TTL, max_entries: int = 5000):
+        self.store = SQLiteCache("llm_responses", ttl, max_entries=max_entries)
+        self.saved_seconds = 0.0
+        self.bypassed = 0
+        # key -> time of the missed lookup, to learn how long the real call took
+        self._misses: dict[str, float] = {}
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        try:
+            prompt = json.dumps(_normalize(json.loads(prompt)), sort_keys=True)
+        except ValueError:
+            prompt = re.sub(r"\s+", " ", prompt).strip()
+        llm_string = _STREAM_PARAM.sub("", llm_string)
+        return hashlib.sha256(f"{llm_string}\x00{prompt}".encode()).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str):
+        key = self._key(prompt, llm_string)
+        if _bypass.get():
+            self.bypassed += 1
+            self._misses[key] = time.perf_counter()
+            return None
+        hit = self.store.get(key)
+        if hit is None:
+            self._misses[key] = time.perf_counter()
+            return None
+        self.saved_seconds += hit.get("latency", 0.0)
+        return [
+            ChatGeneration(message=messages_from_dict([g["message"]])[0], generation_info=g.get("info"))
+            if "message" in g else Generation(text=g["text"], generation_info=g.get("info"))
+            for g in hit["generations"]
+        ]
+
+    def update(self, prompt: str, llm_string: str, return_val) -> None:
+        key = self._key(prompt, llm_string)
+        started = self._misses.pop(key, None)
+        gens = []
+        for g in return_val:
+            if isinstance(g, ChatGeneration):
+                gens.append({"message": message_to_dict(g.message), "info": g.generation_info})
+            else:
+                gens.append({"text": g.text, "info": g.generation_info})
+        latency = time.perf_counter() - started if started is not None else 0.0
+        self.store.set(key, {"generations": gens, "latency": latency})
+
+    # SQLite lookups take well under a millisecond; skip the executor hop of the default async versions
+    async def alookup(self, prompt: str, llm_string: str):
+        return self.lookup(prompt, llm_string)
+
+    async def aupdate(self, prompt: str, llm_string: str, return_val) -> None:
+        self.update(prompt, llm_string, return_val)
+
+    def clear(self, **kwargs) -> None:
+        self.store.clear()
+
+    def stats(self) -> dict:
+        return {**self.store.stats(), "bypassed": self.bypassed, "saved_s": round(self.saved_seconds, 3)}
+
+    def report(self) -> None:
+        st = self.stats()
+        print(f"LLM cache: {st['hits']}/{st['hits'] + st['misses']} hits ({st['hit_rate']:.0%}), "
+              f"~{st['saved_s']:.2f}s saved, {st['bypassed']} bypassed", file=sys.stderr)
+
+@contextlib.contextmanager
+def bypass(active: bool = True):
+    """Skip cache reads (responses are still stored) for calls made inside this block."""
+    token = _bypass.set(active)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
@@ -0,0 +1,350 @@
+"""
+Recovery for tool-call markup leaked into the agent's final answer.
+
+Llama models on Groq sometimes answer with text such as
+`<function=multiple>{"a": <function=add>{"a": 3, "b": 5}</function>, "b": 12}</function>`
+instead of making a real tool call. Those calls are parsed here (JSON objects,
+Python-style keyword or positional arguments, nested calls), checked against the
+loaded MCP tool schemas, and run directly through the tools, innermost first. Only
+text that fails to parse or validate goes back to the model for a rewrite.
+"""
+import asyncio
+import json
+import re
+import sys
+import time
+from dataclasses import dataclass, field
+
+from servers import tracing
+
+_OPEN = "<function"
+_CLOSE = "</function>"
+_NAME = re.compile(r"[A-Za-z_][\w.-]*")
+_NUMBER = re.compile(r"-?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?")
+_LITERALS = {"true": True, "false": False, "null": None, "True": True, "False": False, "None": None}
+# Assumed cost of an LLM reformat round trip before any model call has been timed
+DEFAULT_REFORMAT_S = 1.5
+
+class MarkupError(ValueError):
+    pass
+
+@dataclass
+class Call:
+    name: str
+    kwargs: dict = field(default_factory=dict)
+    positional: list = field(default_factory=list)
+
+class _Parser:
+    def __init__(self, text: str, pos: int = 0):
+        self.s = text
+        self.i = pos
+
+    def _ws(self) -> None:
+        while self.i < len(self.s) and self.s[self.i].isspace():
+            self.i += 1
+
+    def _accept(self, lit: str) -> bool:
+        self._ws()
+        if self.s.startswith(lit, self.i):
+            self.i += len(lit)
+            return True
+        return False
+
+    def _expect(self, lit: str) -> None:
+        if not self._accept(lit):
+            raise MarkupError(f"expected {lit!r} at {self.i}: {self.s[self.i:self.i + 20]!r}")
+
+    def _name(self) -> str:
+        self._ws()
+        m = _NAME.match(self.s, self.i)
+        if not m:
+            raise MarkupError(f"expected a name at {self.i}")
+        self.i = m.end()
+        return m.group()
+
+    def call(self) -> Call:
+        self._expect(_OPEN)
+        self._accept("=")
+        call = Call(self._name())
+        tag_closed = self._accept(">")
+        self._ws()
+        if self.s.startswith("(", self.i):
+            self._arglist(call)
+        elif self.s.startswith("{", self.i):
+            call.kwargs = self._object()
+        if not tag_closed:
+            self._accept(">")
+        # The closing tag is often dropped, especially on nested calls
+        self._accept(_CLOSE)
+        return call
+
+    def _arglist(self, call: Call) -> None:
+        self._expect("(")
+        while not self._accept(")"):
+            self._ws()
+            m = _NAME.match(self.s, self.i)
+            if m and re.match(r"\s*=(?!=)", self.s[m.end():]):
+                self.i = m.end()
+                self._expect("=")
+                call.kwargs[m.group()] = self.value()
+            elif call.kwargs:
+                raise MarkupError("positional argument after keyword argument")
+            else:
+                call.positional.append(self.value())
+            if not self._accept(","):
+                self._expect(")")
+                break
+
+    def _object(self) -> dict:
+        self._expect("{")
+        out = {}
+        while not self._accept("}"):
+            self._ws()
+            key = self._string() if self.s[self.i:self.i + 1] in "\"'" else self._name()
+            if not self._accept(":"):
+                self._expect("=")
+            out[key] = self.value()
+            if not self._accept(","):
+                self._expect("}")
+                break
+        return out
+
+    def _array(self) -> list:
+        self._expect("[")
+        out = []
+        while not self._accept("]"):
+            out.append(self.value())
+            if not self._accept(","):
+                self._expect("]")
+                break
+        return out
+
+    def _string(self) -> str:
+        quote = self.s[self.i]
+        j = self.i + 1
+        while j < len(self.s) and self.s[j] != quote:
+            j += 2 if self.s[j] == "\\" else 1
+        if j >= len(self.s):
+            raise MarkupError("unterminated string")
+        raw = self.s[self.i + 1:j]
+        self.i = j + 1
+        if quote == "'":
+            raw = raw.replace("\\'", "'").replace('"', '\\"')
+        try:
+            return json.loads(f'"{raw}"')
+        except ValueError:
+            return raw
+
+    def value(self):
+        self._ws()
+        if self.s.startswith(_OPEN, self.i):
+            return self.call()
+        c = self.s[self.i:self.i + 1]
+        if c == "{":
+            return self._object()
+        if c == "[":
+            return self._array()
+        if c and c in "\"'":
+            return self._string()
+        m = _NUMBER.match(self.s, self.i)
+        if m:
+            self.i = m.end()
+            text = m.group()
+            return float(text) if any(ch in text for ch in ".eE") else int(text)
+        m = _NAME.match(self.s, self.i)
+        if m and m.group() in _LITERALS:
+            self.i = m.end()
+            return _LITERALS[m.group()]
+        raise MarkupError(f"unexpected value at {self.i}: {self.s[self.i:self.i + 20]!r}")
+
+def find_calls(text: str) -> list[tuple[int, int, Call]]:
+    """(start, end, call) for every top-level `<function...>` in `text`; raises MarkupError."""
+    found = []
+    pos = text.find(_OPEN)
+    while pos >= 0:
+        parser = _Parser(text, pos)
+        call = parser.call()
+        found.append((pos, parser.i, call))
+        pos = text.find(_OPEN, parser.i)
+    return found
+
+def _types(schema: dict) -> list[str]:
+    if "type" in schema:
+        t = schema["type"]
+        return t if isinstance(t, list) else [t]
+    return [t for sub in schema.get("anyOf", []) for t in _types(sub)]
+
+def _coerce(value, schema: dict, where: str):
+    """Convert `value` (often the text result of a nested call) to the type the schema asks for."""
+    types = _types(schema)
+    if not types:
+        return value
+    if value is None and "null" in types:
+        return None
+    for t in types:
+        try:
+            if t == "integer":
+                if isinstance(value, bool):
+                    continue
+                if isinstance(value, str) and re.fullmatch(r"\s*-?\d+\s*", value):
+                    return int(value)  # exact, even beyond float precision
+                number = float(value) if isinstance(value, str) else value
+                if isinstance(number, (int, float)) and float(number).is_integer():
+                    return int(number)
+            elif t == "number":
+                if not isinstance(value, bool):
+                    return float(value) if isinstance(value, str) else value + 0
+            elif t == "string":
+                return value if isinstance(value, str) else json.dumps(value)
+            elif t == "boolean" and isinstance(value, bool):
+                return value
+            elif t == "array":
+                value = json.loads(value) if isinstance(value, str) else value
+                if isinstance(value, list):
+                    return [_coerce(v, schema.get("items", {}), where) for v in value]
+            elif t == "object":
+                value = json.loads(value) if isinstance(value, str) else value
+                if isinstance(value, dict):
+                    return value
+        except (TypeError, ValueError):
+            continue
+    raise MarkupError(f"{where}: {value!r} is not {'/'.join(types)}")
+
+def _bind(call: Call, schema: dict) -> dict:
+    """Map positional and keyword arguments onto the tool's parameters, rejecting unknown or missing ones."""
+    props = schema.get("properties", {})
+    if len(call.positional) > len(props):
+        raise MarkupError(f"{call.name}: too many positional arguments")
+    args = dict(call.kwargs)
+    for name, value in zip(props, call.positional):
+        if name in args:
+            raise MarkupError(f"{call.name}: {name} given twice")
+        args[name] = value
+    unknown = set(args) - set(props)
+    missing = [p for p in schema.get("required", []) if p not in args]
+    if unknown:
+        raise MarkupError(f"{call.name}: unknown argument(s) {sorted(unknown)}")
+    if missing:
+        raise MarkupError(f"{call.name}: missing argument(s) {missing}")
+    return args
+
+def _content(result) -> str:
+    if isinstance(result, list):
+        return "\n".join(r if isinstance(r, str) else str(r) for r in result)
+    return result if isinstance(result, str) else str(result)
+
+class MarkupRecovery:
+    """Runs leaked tool calls through the real tools and keeps recovery counters."""
+
+    def __init__(self, tools: list):
+        self.tools = {t.name: t for t in tools}
+        self.stats = {"leaks": 0, "recovered": 0, "fallback": 0, "recover_s": 0.0, "saved_s": 0.0}
+        # Moving average of the LLM reformat round trip, to estimate what a local recovery saved
+        self.reformat_latency: float | None = None
+
+    def _schema(self, name: str) -> dict:
+        tool = self.tools.get(name)
+        if tool is None:
+            raise MarkupError(f"unknown tool {name!r}")
+        schema = tool.args_schema
+        return schema if isinstance(schema, dict) else schema.model_json_schema()
+
+    def validate(self, call: Call) -> None:
+        """Check `call` and every nested call against the tool schemas before anything runs."""
+        args = _bind(call, self._schema(call.name))
+        for value in args.values():
+            for inner in _nested(value):
+                self.validate(inner)
+
+    async def _resolve(self, value):
+        if isinstance(value, Call):
+            return await self.run(value)
+        if isinstance(value, list):
+            return list(await asyncio.gather(*(self._resolve(v) for v in value)))
+        if isinstance(value, dict):
+            keys = list(value)
+            vals = await asyncio.gather(*(self._resolve(value[k]) for k in keys))
+            return dict(zip(keys, vals))
+        return value
+
+    async def run(self, call: Call) -> str:
+        schema = self._schema(call.name)
+        args = _bind(call, schema)
+        names = list(args)
+        values = await asyncio.gather(*(self._resolve(args[n]) for n in names))
+        props = schema.get("properties", {})
+        args = {n: _coerce(v, props.get(n, {}), f"{call.name}.{n}") for n, v in zip(names, values)}
+        return _content(await self.tools[call.name].ainvoke(args)).strip()
+
+    async def recover(self, text: str) -> tuple[str, list[str]] | None:
+        """
+        Replace each leaked call in `text` with its result. Returns (text, tool names used),
+        or None when the markup can't be parsed, validated or run, so the caller can fall back.
+        """
+        self.stats["leaks"] += 1
+        t = time.perf_counter()
+        try:
+            calls = find_calls(text)
+            for _, _, call in calls:
+                self.validate(call)
+            results = await asyncio.gather(*(self.run(call) for _, _, call in calls))
+        except Exception as e:
+            print("Markup recovery failed:", e, file=sys.stderr)
+            self.stats["fallback"] += 1
+            return None
+        parts, prev = [], 0
+        for (start, end, _), result in zip(calls, results):
+            parts += [text[prev:start], result]
+            prev = end
+        prose = "".join(text[a:b] for a, b in _gaps(calls, len(text))).replace(_CLOSE, "").strip()
+        # Nothing but markup: the results are the answer
+        recovered = "".join(parts + [text[prev:]]).replace(_CLOSE, "").strip() if prose else "\n".join(results)
+        elapsed = time.perf_counter() - t
+        self.stats["recovered"] += 1
+        self.stats["recover_s"] += elapsed
+        self.stats["saved_s"] += max(0.0, self.reformat_estimate() - elapsed)
+        return recovered, sorted({n for _, _, c in calls for n in _names(c)})
+
+    def reformat_estimate(self) -> float:
+        """
+        What a reformat would cost: the measured reformat average once one has happened,
+        else the recent `llm` span average, else DEFAULT_REFORMAT_S.
+        """
+        if self.reformat_latency is not None:
+            return self.reformat_latency
+        llm = tracing.recent_mean("llm")
+        return llm if llm is not None else DEFAULT_REFORMAT_S
+
+    def record_fallback(self, latency: float) -> None:
+        self.reformat_latency = latency if self.reformat_latency is None else 0.8 * self.reformat_latency + 0.2 * latency
+
+    def report(self) -> None:
+        s = self.stats
+        if not s["leaks"]:
+            return
+        print(f"Markup recovery: {s['recovered']}/{s['leaks']} recovered locally "
+              f"({s['recovered'] / s['leaks']:.0%}), {s['fallback']} sent to the model, "
+              f"~{s['saved_s']:.2f}s saved vs reformat", file=sys.stderr)
+
+def _nested(value):
+    if isinstance(value, Call):
+        yield value
+    elif isinstance(value, list):
+        for v in value:
+            yield from _nested(v)
+    elif isinstance(value, dict):
+        for v in value.values():
+            yield from _nested(v)
+
+def _names(call: Call):
+    yield call.name
+    for value in [*call.kwargs.values(), *call.positional]:
+        for inner in _nested(value):
+            yield from _names(inner)
+
+def _gaps(calls, length: int):
+    prev = 0
+    for start, end, _ in calls:
+        yield prev, start
+        prev = end
+    yield prev, length
@@ -0,0 +1,268 @@
+"""
+Warm MCP server pool.
+
+Each server in src/servers/ runs as one or more long-lived streamable-http worker
+processes that outlive the client, so later client runs skip the Python start-up +
+import cost. Servers are started lazily, on the first tool call that needs them, and
+tool schemas are cached on disk keyed by a hash of each server's source, so loading
+tools needs no MCP handshake.
+
+With POOL_WORKERS=N (or `start --workers N`), worker i of a server listens on its base
+port + i * WORKER_PORT_STRIDE, and tool calls are spread over the workers by a
+least-outstanding-requests balancer with health checks and failover (balancer.py).
+MCP_<SERVER>_URLS="http://host:port/mcp,..." points a server at externally run
+endpoints instead; those are balanced the same way but never spawned.
+
+    python src/pool.py start [--workers N]|stop|status
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from balancer import Balancer
+from servers.cache import CACHE_DIR
+from servers.tracing import http_client_factory
+
+SERVERS_DIR = Path(__file__).resolve().parent / "servers"
+HOST = "127.0.0.1"
+SERVERS = {
+    "math": {"script": SERVERS_DIR / "mathserver.py", "port": 8001},
+    "weather": {"script": SERVERS_DIR / "weather.py", "port": 8000},
+    "search": {"script": SERVERS_DIR / "search.py", "port": 8002},
+}
+START_TIMEOUT = 30.0
+SCHEMA_FILE = CACHE_DIR / "tool_schemas.json"
+RUN_DIR = CACHE_DIR / "pool"
+WORKERS = int(os.getenv("POOL_WORKERS", "1"))
+WORKER_PORT_STRIDE = 100
+
+_locks: dict[str, asyncio.Lock] = {}
+_balancers: dict[str, Balancer] = {}
+
+def _external(name: str) -> list[str]:
+    return [u.strip() for u in os.getenv(f"MCP_{name.upper()}_URLS", "").split(",") if u.strip()]
+
+def workers(name: str) -> int:
+    """Local worker count: POOL_WORKERS, or more if `start --workers` launched more."""
+    try:
+        started = int((RUN_DIR / f"{name}.workers").read_text())
+    except (OSError, ValueError):
+        started = 0
+    return max(WORKERS, started, 1)
+
+def _ports(name: str) -> list[int]:
+    return [SERVERS[name]["port"] + i * WORKER_PORT_STRIDE for i in range(workers(name))]
+
+def endpoints(name: str) -> list[str]:
+    return _external(name) or [f"http://{HOST}:{port}/mcp" for port in _ports(name)]
+
+def connection(name: str, url: str | None = None) -> dict:
+    # The client factory forwards the caller's trace context (traceparent header) to the server
+    return {"url": url or endpoints(name)[0], "transport": "streamable_http",
+            "httpx_client_factory": http_client_factory}
+
+def _source_hash(script: Path) -> str:
+    """Hash a server script plus the sibling modules it imports (e.g. cache.py)."""
+    h = hashlib.sha256()
+    src = script.read_bytes()
+    h.update(src)
+    for mod in sorted(set(re.findall(rb"^(?:from|import)\s+(\w+)", src, flags=re.M))):
+        sibling = script.parent / f"{mod.decode()}.py"
+        if sibling.exists():
+            h.update(sibling.read_bytes())
+    return h.hexdigest()
+
+async def _is_up(port: int, host: str = HOST) -> bool:
+    try:
+        _, writer = await asyncio.open_connection(host, port)
+    except OSError:
+        return False
+    writer.close()
+    await writer.wait_closed()
+    return True
+
+async def probe(url: str) -> bool:
+    """Health check: the endpoint accepts TCP connections."""
+    parts = urlsplit(url)
+    return await _is_up(parts.port or 80, parts.hostname)
+
+def _pid_file(name: str, i: int) -> Path:
+    return RUN_DIR / (f"{name}.pid" if i == 0 else f"{name}.{i}.pid")
+
+def _hash_file(name: str, i: int) -> Path:
+    # Source hash of the code a worker was started from, next to its pid file
+    return _pid_file(name, i).with_suffix(".hash")
+
+def _stale(name: str, i: int, digest: str) -> bool:
+    """True if we started worker i of `name` from a different version of its source."""
+    if not _pid_file(name, i).exists():
+        return False  # not started by the pool (e.g. run by hand); leave it alone
+    try:
+        return _hash_file(name, i).read_text() != digest
+    except OSError:
+        return True
+
+def _stop_worker(name: str, i: int) -> None:
+    try:
+        pid = int(_pid_file(name, i).read_text())
+        os.kill(pid, signal.SIGTERM)
+        print(f"[Pool] stopped {name} worker {i} (pid {pid})", file=sys.stderr)
+    except (OSError, ValueError):
+        pass
+    _pid_file(name, i).unlink(missing_ok=True)
+    _hash_file(name, i).unlink(missing_ok=True)
+
+def _spawn(name: str, i: int, port: int, digest: str) -> None:
+    spec = SERVERS[name]
+    RUN_DIR.mkdir(parents=True, exist_ok=True)
+    log = open(RUN_DIR / f"{name}.log", "ab")
+    # New session: the server keeps running after this client exits
+    proc = subprocess.Popen(
+        [sys.executable, str(spec["script"]), "--transport", "streamable-http", "--port", str(port)],
+        stdin=subprocess.DEVNULL, stdout=log, stderr=log, cwd=str(spec["script"].parent),
+        start_new_session=True,
+    )
+    _pid_file(name, i).write_text(str(proc.pid))
+    _hash_file(name, i).write_text(digest)
+    print(f"[Pool] started {name} worker {i} (pid {proc.pid}, port {port})", file=sys.stderr)
+
+async def _ensure_worker(name: str, i: int, port: int) -> None:
+    """Start worker i unless it is listening and running the current source."""
+    digest = _source_hash(SERVERS[name]["script"])
+    if await _is_up(port) and not _stale(name, i, digest):
+        return
+    lock = _locks.setdefault(f"{name}:{i}", asyncio.Lock())
+    async with lock:
+        if await _is_up(port):
+            if not _stale(name, i, digest):
+                return
+            print(f"[Pool] {name} worker {i} runs outdated code, restarting", file=sys.stderr)
+            _stop_worker(name, i)
+            deadline = time.monotonic() + START_TIMEOUT
+            while await _is_up(port):
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"outdated {name} worker on port {port} did not stop")
+                await asyncio.sleep(0.1)
+        _spawn(name, i, port, digest)
+        deadline = time.monotonic() + START_TIMEOUT
+        while not await _is_up(port):
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{name} server did not start within {START_TIMEOUT:.0f}s (see {RUN_DIR / (name + '.log')})")
+            await asyncio.sleep(0.1)
+
+async def ensure_server(name: str) -> None:
+    """Start any local worker of `name` that isn't listening yet (external endpoints are left alone)."""
+    if _external(name):
+        return
+    await asyncio.gather(*(_ensure_worker(name, i, port) for i, port in enumerate(_ports(name))))
+
+def balancer(name: str) -> Balancer:
+    """The shared balancer over the endpoints of `name`."""
+    if name not in _balancers:
+        async def restart(endpoint):
+            await ensure_server(name)
+
+        _balancers[name] = Balancer(name, [connection(name, url) for url in endpoints(name)], probe,
+                                    start=lambda: ensure_server(name), on_down=restart)
+    return _balancers[name]
+
+def _read_schemas() -> dict:
+    try:
+        return json.loads(SCHEMA_FILE.read_text())
+    except (OSError, ValueError):
+        return {}
+
+async def _schemas(name: str) -> list:
+    """Tool schemas for `name` from the disk cache, or from the (started) server on a miss."""
+    from mcp.types import Tool as MCPTool
+    from langchain_mcp_adapters.sessions import create_session
+    from langchain_mcp_adapters.tools import _list_all_tools
+
+    digest = _source_hash(SERVERS[name]["script"])
+    cached = _read_schemas().get(name)
+    if cached and cached.get("hash") == digest:
+        return [MCPTool.model_validate(t) for t in cached["tools"]]
+    await ensure_server(name)
+    async with create_session(connection(name)) as session:
+        await session.initialize()
+        tools = await _list_all_tools(session)
+    data = _read_schemas()
+    data[name] = {"hash": digest, "tools": [t.model_dump(mode="json", exclude_none=True) for t in tools]}
+    SCHEMA_FILE.parent.mkdir(parents=True, exist_ok=True)
+    SCHEMA_FILE.write_text(json.dumps(data))
+    return tools
+
+def balanced_tools(bal: Balancer, mcp_tools: list) -> list:
+    """LangChain tools for `mcp_tools` whose calls go through `bal` (which also starts the servers)."""
+    from langchain_mcp_adapters.tools import convert_mcp_tool_to_langchain_tool
+
+    variants = [[convert_mcp_tool_to_langchain_tool(None, t, connection=ep.connection) for t in mcp_tools]
+                for ep in bal.endpoints]
+    return bal.wrap_tools(variants)
+
+async def load_tools(names=None) -> list:
+    """LangChain tools for the pooled servers (all of SERVERS by default)."""
+    names = list(names or SERVERS)
+    per_server = await asyncio.gather(*(_schemas(n) for n in names))
+    return [t for n, tools in zip(names, per_server) for t in balanced_tools(balancer(n), tools)]
+
+async def time_to_ready(name: str) -> float:
+    """Seconds until `name` answers an MCP initialize (starting it first if it is down)."""
+    from langchain_mcp_adapters.sessions import create_session
+
+    t = time.perf_counter()
+    await ensure_server(name)
+    async with create_session(connection(name)) as session:
+        await session.initialize()
+    return time.perf_counter() - t
+
+def stop(names=None) -> None:
+    for name in names or SERVERS:
+        for pid_file in [*RUN_DIR.glob(f"{name}.pid"), *RUN_DIR.glob(f"{name}.*.pid")]:
+            try:
+                pid = int(pid_file.read_text())
+                os.kill(pid, signal.SIGTERM)
+                print(f"[Pool] stopped {name} worker (pid {pid})")
+            except (OSError, ValueError):
+                pass
+            pid_file.unlink(missing_ok=True)
+            pid_file.with_suffix(".hash").unlink(missing_ok=True)
+        (RUN_DIR / f"{name}.workers").unlink(missing_ok=True)
+
+async def status() -> dict:
+    """{name: {url: up}} for every endpoint of every server."""
+    return {name: await balancer(name).check() for name in SERVERS}
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Manage the warm MCP server pool")
+    parser.add_argument("action", choices=["start", "stop", "status"])
+    parser.add_argument("servers", nargs="*", help=f"Subset of {', '.join(SERVERS)} (default all)")
+    parser.add_argument("--workers", type=int, help="Worker processes per server for start (default POOL_WORKERS)")
+    args = parser.parse_args()
+
+    if args.action == "start":
+        if args.workers:
+            # Recorded so clients started later use every worker, whatever their POOL_WORKERS
+            RUN_DIR.mkdir(parents=True, exist_ok=True)
+            for name in args.servers or SERVERS:
+                (RUN_DIR / f"{name}.workers").write_text(str(args.workers))
+        async def start_all():
+            await asyncio.gather(*(ensure_server(n) for n in args.servers or SERVERS))
+            await asyncio.gather(*(_schemas(n) for n in args.servers or SERVERS))
+        asyncio.run(start_all())
+    elif args.action == "stop":
+        stop(args.servers)
+    for name, urls in asyncio.run(status()).items():
+        up = sum(urls.values())
+        detail = ", ".join(f"{u} {'up' if ok else 'down'}" for u, ok in urls.items())
+        print(f"{name}: {up}/{len(urls)} up ({detail})")
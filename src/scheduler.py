@@ -0,0 +1,274 @@
+"""
+Central scheduler for Groq and MCP tool calls.
+
+Every Groq HTTP request goes through `Scheduler.transport()`, an httpx transport
+handed to ChatGroq. It waits on token buckets for requests/min and tokens/min,
+tightens them from the `x-ratelimit-*` response headers, pauses all callers on a
+429 for `retry-after`, and retries transient failures with jittered exponential
+backoff inside a per-call deadline. ChatGroq's own retries are switched off so a
+429 is never retried twice over. Tool coroutines are wrapped (`wrap_tool`) with a
+concurrency cap, a deadline and retries on connection errors.
+"""
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import time
+
+import httpx
+
+# Defaults match the Groq free tier for llama-3.3-70b-versatile; headers refine them at runtime
+GROQ_RPM = float(os.getenv("GROQ_RPM", "30"))
+GROQ_TPM = float(os.getenv("GROQ_TPM", "12000"))
+LLM_DEADLINE = float(os.getenv("LLM_CALL_DEADLINE", "60"))
+LLM_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+TOOL_DEADLINE = float(os.getenv("TOOL_CALL_DEADLINE", "45"))
+TOOL_RETRIES = int(os.getenv("TOOL_MAX_RETRIES", "2"))
+TOOL_CONCURRENCY = int(os.getenv("TOOL_CONCURRENCY", "8"))
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 20.0
+# Tokens reserved for the completion when the request does not set max_tokens
+DEFAULT_COMPLETION_TOKENS = 512
+
+RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504}
+# Transport-level failures worth another attempt (connection refused while a pooled server starts, resets, ...)
+TRANSIENT_ERRORS = (httpx.TransportError, ConnectionError, OSError)
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+def _seconds(value: str | None) -> float | None:
+    """Parse Groq durations ("7.66s", "2m59.56s", "120ms") and plain retry-after seconds."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    total, matched = 0.0, False
+    for num, unit in re.findall(r"([\d.]+)(ms|h|m|s)", value):
+        matched = True
+        total += float(num) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+    return total if matched else None
+
+def _backoff(attempt: int) -> float:
+    # Full jitter: spreads retries of callers that failed together
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+def estimate_tokens(body: bytes) -> int:
+    """Rough prompt + completion token count for a chat completion request body."""
+    try:
+        payload = json.loads(body or b"{}")
+    except ValueError:
+        return len(body) // 4
+    text = json.dumps(payload.get("messages", [])) + json.dumps(payload.get("tools", []))
+    completion = payload.get("max_tokens") or payload.get("max_completion_tokens") or DEFAULT_COMPLETION_TOKENS
+    return len(text) // 4 + int(completion)
+
+class TokenBucket:
+    """Refills at `per_minute / 60` per second up to `capacity`; waiters are served in FIFO order."""
+
+    def __init__(self, per_minute: float, capacity: float | None = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, n: float, deadline: float) -> float:
+        """Take `n` tokens, waiting as needed. Returns seconds waited; raises DeadlineExceeded."""
+        n = min(n, self.capacity)  # an oversized request waits for a full bucket rather than forever
+        start = time.monotonic()
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return time.monotonic() - start
+                wait = (n - self.tokens) / self.rate
+                if time.monotonic() + wait > deadline:
+                    raise DeadlineExceeded(f"rate limit wait of {wait:.1f}s exceeds the call deadline")
+                await asyncio.sleep(wait)
+
+    def observe(self, limit: float | None, remaining: float | None, reset: float | None) -> None:
+        """Align with the provider's view: adopt its limit, and never believe we have more than it says."""
+        self._refill()
+        if limit:
+            self.capacity = limit
+            self.rate = limit / 60.0
+        if remaining is not None and remaining < self.tokens:
+            self.tokens = remaining
+            if remaining <= 0 and reset:
+                # Empty until the provider's window resets; express that as negative credit
+                self.tokens = -reset * self.rate
+
+class Scheduler:
+    def __init__(self, rpm: float = GROQ_RPM, tpm: float = GROQ_TPM, deadline: float = LLM_DEADLINE,
+                 retries: int = LLM_RETRIES, tool_deadline: float = TOOL_DEADLINE,
+                 tool_retries: int = TOOL_RETRIES, tool_concurrency: int = TOOL_CONCURRENCY):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.deadline = deadline
+        self.retries = retries
+        self.tool_deadline = tool_deadline
+        self.tool_retries = tool_retries
+        self._tool_slots = asyncio.Semaphore(tool_concurrency)
+        self._paused_until = 0.0
+        self.stats = {"llm_calls": 0, "llm_ok": 0, "rate_limited": 0, "llm_retries": 0, "waited_s": 0.0,
+                      "tool_calls": 0, "tool_retries": 0, "deadline_exceeded": 0}
+
+    # --- Groq HTTP requests -------------------------------------------------
+
+    def transport(self, inner: httpx.AsyncBaseTransport | None = None) -> "ScheduledTransport":
+        return ScheduledTransport(self, inner or httpx.AsyncHTTPTransport())
+
+    def http_client(self) -> httpx.AsyncClient:
+        """httpx client for `ChatGroq(http_async_client=...)`; pair it with `max_retries=0`."""
+        return httpx.AsyncClient(transport=self.transport(), timeout=httpx.Timeout(self.deadline, connect=10.0))
+
+    def _observe(self, headers: httpx.Headers) -> None:
+        # Groq: *-tokens is the per-minute token window; *-requests is the per-day request quota
+        self.tokens.observe(_seconds(headers.get("x-ratelimit-limit-tokens")),
+                            _seconds(headers.get("x-ratelimit-remaining-tokens")),
+                            _seconds(headers.get("x-ratelimit-reset-tokens")))
+        remaining = _seconds(headers.get("x-ratelimit-remaining-requests"))
+        reset = _seconds(headers.get("x-ratelimit-reset-requests"))
+        if remaining is not None and remaining <= 0 and reset:
+            self._pause(reset)
+
+    def _pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def _admit(self, cost: int, deadline: float) -> None:
+        pause = self._paused_until - time.monotonic()
+        if pause > 0:
+            if time.monotonic() + pause > deadline:
+                raise DeadlineExceeded(f"rate limited for another {pause:.1f}s, past the call deadline")
+            await asyncio.sleep(pause)
+            self.stats["waited_s"] += pause
+        self.stats["waited_s"] += await self.requests.acquire(1, deadline)
+        self.stats["waited_s"] += await self.tokens.acquire(cost, deadline)
+
+    async def send(self, request: httpx.Request, inner: httpx.AsyncBaseTransport) -> httpx.Response:
+        self.stats["llm_calls"] += 1
+        deadline = time.monotonic() + self.deadline
+        try:
+            cost = estimate_tokens(request.content)
+        except httpx.RequestNotRead:
+            cost = DEFAULT_COMPLETION_TOKENS
+        attempt = 0
+        resampled = False  # a tool_use_failed response gets one resample, whatever retries came before
+        while True:
+            try:
+                await self._admit(cost, deadline)
+            except DeadlineExceeded:
+                self.stats["deadline_exceeded"] += 1
+                raise
+            try:
+                response = await asyncio.wait_for(inner.handle_async_request(request),
+                                                  max(0.1, deadline - time.monotonic()))
+            except (asyncio.TimeoutError, *TRANSIENT_ERRORS) as e:
+                if attempt >= self.retries or time.monotonic() >= deadline:
+                    if isinstance(e, asyncio.TimeoutError):
+                        self.stats["deadline_exceeded"] += 1
+                        raise DeadlineExceeded(f"no response within {self.deadline:.0f}s") from e
+                    raise
+                delay = None
+            else:
+                self._observe(response.headers)
+                retry, response, delay = await self._should_retry(response, attempt, resampled)
+                if not retry:
+                    self.stats["llm_ok"] += response.status_code < 400
+                    return response
+                resampled = resampled or response.status_code == 400
+            attempt += 1
+            delay = delay if delay is not None else _backoff(attempt)
+            if time.monotonic() + delay > deadline:
+                self.stats["deadline_exceeded"] += 1
+                raise DeadlineExceeded(f"gave up after {attempt} attempt(s); next retry would pass the deadline")
+            self.stats["llm_retries"] += 1
+            print(f"[Scheduler] retry {attempt}/{self.retries} in {delay:.1f}s", file=sys.stderr)
+            await asyncio.sleep(delay)
+
+    async def _should_retry(self, response: httpx.Response, attempt: int, resampled: bool = False):
+        """(retry?, response to return, delay) for a received response."""
+        status = response.status_code
+        if status < 400 or attempt >= self.retries:
+            return False, response, None
+        if status == 400:
+            # Groq rejects malformed tool calls from the model ("tool_use_failed"); a resample usually works
+            # (the body is small; reading it here leaves it cached for the caller)
+            body = await response.aread()
+            await response.aclose()
+            return b"tool_use_failed" in body and not resampled, response, 0.0
+        if status not in RETRY_STATUS or response.headers.get("x-should-retry") == "false":
+            return False, response, None
+        await response.aclose()
+        delay = _seconds(response.headers.get("retry-after"))
+        if status == 429:
+            self.stats["rate_limited"] += 1
+            delay = (delay if delay is not None else _backoff(attempt + 1)) + random.uniform(0, BACKOFF_BASE)
+            # Everyone waits, not just this caller: the limit is shared
+            self._pause(delay)
+        return True, response, delay
+
+    # --- MCP tool calls ---------------------------------------------------
+
+    async def call_tool(self, fn, *args, **kwargs):
+        """Run `await fn(*args, **kwargs)` with the tool concurrency cap, deadline and retries."""
+        self.stats["tool_calls"] += 1
+        deadline = time.monotonic() + self.tool_deadline
+        async with self._tool_slots:
+            for attempt in range(self.tool_retries + 1):
+                try:
+                    return await asyncio.wait_for(fn(*args, **kwargs), max(0.1, deadline - time.monotonic()))
+                except asyncio.TimeoutError as e:
+                    self.stats["deadline_exceeded"] += 1
+                    raise DeadlineExceeded(f"tool call exceeded {self.tool_deadline:.0f}s") from e
+                except TRANSIENT_ERRORS:
+                    delay = _backoff(attempt + 1)
+                    if attempt >= self.tool_retries or time.monotonic() + delay > deadline:
+                        raise
+                    self.stats["tool_retries"] += 1
+                    await asyncio.sleep(delay)
+
+    def wrap_tool(self, tool):
+        call = tool.coroutine
+
+        async def scheduled_call(**arguments):
+            return await self.call_tool(call, **arguments)
+
+        tool.coroutine = scheduled_call
+        return tool
+
+    def report(self) -> None:
+        s = self.stats
+        print(f"Scheduler: {s['llm_ok']}/{s['llm_calls']} LLM calls ok, {s['rate_limited']} rate-limited, "
+              f"{s['llm_retries']} retries, {s['waited_s']:.1f}s queued; {s['tool_calls']} tool calls, "
+              f"{s['tool_retries']} retries; {s['deadline_exceeded']} past deadline", file=sys.stderr)
+
+class ScheduledTransport(httpx.AsyncBaseTransport):
+    def __init__(self, scheduler: Scheduler, inner: httpx.AsyncBaseTransport):
+        self.scheduler = scheduler
+        self.inner = inner
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self.scheduler.send(request, self.inner)
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
+
+def is_rate_limit(exc: BaseException) -> bool:
+    """True for provider rate-limit errors (after the scheduler's retries ran out) and deadline misses."""
+    while exc is not None:
+        if isinstance(exc, DeadlineExceeded) or getattr(exc, "status_code", None) == 429:
+            return True
+        exc = exc.__cause__
+    return False
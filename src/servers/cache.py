@@ -0,0 +1,122 @@
+"""
+Small on-disk TTL + LRU cache backed by SQLite, plus an asyncio single-flight helper.
+
+Used by the MCP servers (and the client) to avoid repeating network round trips
+for identical requests. Values are stored as JSON.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+CACHE_DIR = Path(os.getenv("MCP_CACHE_DIR", Path.home() / ".cache" / "mcp-chatbot"))
+
+
+class SQLiteCache:
+    """
+    Key/value cache in a SQLite table with a per-table TTL and size bound.
+      - Expired rows are treated as misses and dropped on read.
+      - When the table grows past `max_entries` rows or `max_bytes` of values,
+        the least recently used rows are evicted.
+    """
+
+    def __init__(self, name: str, ttl: float, max_entries: int = 1000, max_bytes: int = 64 * 1024 * 1024,
+                 path: str | Path | None = None):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        path = Path(path) if path else CACHE_DIR / "cache.sqlite3"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(path), check_same_thread=False, timeout=10)
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                f'CREATE TABLE IF NOT EXISTS "{name}" ('
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.execute(f'CREATE INDEX IF NOT EXISTS "{name}_accessed" ON "{name}" (accessed)')
+
+    def get(self, key: str):
+        """Return the cached value for `key`, or None on miss/expiry."""
+        now = time.time()
+        with self._lock, self._db:
+            row = self._db.execute(f'SELECT value, created FROM "{self.name}" WHERE key = ?', (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    self._db.execute(f'DELETE FROM "{self.name}" WHERE key = ?', (key,))
+                self.misses += 1
+                return None
+            self._db.execute(f'UPDATE "{self.name}" SET accessed = ? WHERE key = ?', (now, key))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value) -> None:
+        data = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                f'INSERT OR REPLACE INTO "{self.name}" (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)',
+                (key, data, len(data), now, now),
+            )
+            self._evict()
+
+    def _evict(self) -> None:
+        count, total = self._db.execute(f'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM "{self.name}"').fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        # Walk rows oldest-access first until both bounds hold again
+        doomed = []
+        for key, size in self._db.execute(f'SELECT key, size FROM "{self.name}" ORDER BY accessed ASC'):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            count -= 1
+            total -= size
+        self._db.executemany(f'DELETE FROM "{self.name}" WHERE key = ?', doomed)
+
+    def clear(self) -> None:
+        with self._lock, self._db:
+            self._db.execute(f'DELETE FROM "{self.name}"')
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, total = self._db.execute(f'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM "{self.name}"').fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "name": self.name,
+            "entries": count,
+            "bytes": total,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key: the first caller runs the coroutine,
+    later callers await the same result instead of starting their own.
+    """
+
+    def __init__(self):
+        self._inflight: dict[str, asyncio.Future] = {}
+        self.shared = 0
+
+    async def do(self, key: str, fn):
+        fut = self._inflight.get(key)
+        if fut is None:
+            fut = asyncio.ensure_future(fn())
+            self._inflight[key] = fut
+            fut.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.shared += 1
+        # Shield so one waiter being cancelled doesn't cancel the work for the others
+        return await asyncio.shield(fut)
@@ -1,7 +1,121 @@
 from mcp.server.fastmcp import FastMCP
 import math
+import ast
+import re
+import operator
+import os
+import asyncio
+import multiprocessing
+import threading
+from tracing import instrument
 
 mcp=FastMCP("Math")
+instrument(mcp, "math")
+
+# Cost guard for big-integer tools (factorial, power, nCr, nPr).
+# Result size is predicted from the arguments before computing anything:
+#   - small results run inline,
+#   - larger ones run in a worker process (killed after HEAVY_TIMEOUT seconds),
+#   - results predicted beyond MAX_RESULT_BITS or the timeout are rejected up front.
+# Results with more than MAX_OUTPUT_DIGITS digits are returned in compact form.
+INLINE_BITS = 100_000
+MAX_RESULT_BITS = 64_000_000
+HEAVY_TIMEOUT = float(os.getenv("MATH_HEAVY_TIMEOUT", "20"))
+MAX_OUTPUT_DIGITS = 1000
+MAX_IDLE_WORKERS = 2
+
+# Single-process pools not running a job. Each heavy call checks one out, so a timeout
+# only ever kills the worker running that call; spare workers are kept to skip spawn cost.
+_idle: list = []
+_idle_lock = threading.Lock()
+
+def _estimate_seconds(bits: float) -> float:
+    # Big-int multiplication is ~Karatsuba; calibrated at ~0.2s for a 1.5M-bit result.
+    return 0.2 * (bits / 1.5e6) ** 1.585
+
+def _log2_binomial(n: int, k: int) -> float:
+    return (math.lgamma(n + 1) - math.lgamma(k + 1) - math.lgamma(n - k + 1)) / math.log(2)
+
+def _result_bits(name: str, *args) -> float:
+    """Predicted bit-length of the result of a big-integer tool."""
+    if name == "factorial":
+        (n,) = args
+        return math.lgamma(n + 1) / math.log(2) if n > 1 else 1
+    if name == "power":
+        a, b = args
+        if not (isinstance(a, int) and isinstance(b, int)) or b < 0 or abs(a) < 2:
+            return 1  # float / trivial results are cheap (float overflow raises on its own)
+        return b * math.log2(abs(a))
+    if name in ("nCr", "nPr"):
+        n, r = args
+        if n < 0 or r < 0 or r > n:
+            return 1  # out of domain: the tool raises its own error
+        if name == "nCr":
+            return _log2_binomial(n, r)
+        return (math.lgamma(n + 1) - math.lgamma(n - r + 1)) / math.log(2)
+    return 1
+
+def _heavy(fn, args):
+    """Run fn(*args) in a worker process of its own; kill that worker if it exceeds HEAVY_TIMEOUT."""
+    with _idle_lock:
+        pool = _idle.pop() if _idle else None
+    if pool is None:
+        pool = multiprocessing.get_context("spawn").Pool(processes=1)
+    try:
+        result = pool.apply_async(fn, args).get(timeout=HEAVY_TIMEOUT)
+    except multiprocessing.TimeoutError:
+        # Pool.terminate is the only way to stop a running computation; this pool runs nothing else
+        pool.terminate()
+        raise ValueError(f"Computation cancelled after {HEAVY_TIMEOUT:.0f}s.")
+    except BaseException:
+        _release(pool)
+        raise
+    _release(pool)
+    return result
+
+def _release(pool) -> None:
+    with _idle_lock:
+        if len(_idle) < MAX_IDLE_WORKERS:
+            _idle.append(pool)
+            return
+    pool.terminate()
+
+def _guarded(name: str, fn, *args):
+    """Compute fn(*args) according to its predicted cost (blocking; see _call for async callers)."""
+    bits = _result_bits(name, *args)
+    if bits > MAX_RESULT_BITS or _estimate_seconds(bits) > HEAVY_TIMEOUT:
+        raise ValueError(
+            f"{name} result too large: ~{bits * math.log10(2):.3g} digits, "
+            f"estimated {_estimate_seconds(bits):.0f}s (limit {HEAVY_TIMEOUT:.0f}s)."
+        )
+    if bits <= INLINE_BITS:
+        return fn(*args)
+    return _heavy(fn, args)
+
+async def _call(name: str, fn, *args):
+    # Cheap calls stay inline; costly ones wait on the worker from a thread so the server keeps serving.
+    if _result_bits(name, *args) <= INLINE_BITS:
+        return fn(*args)
+    return await asyncio.to_thread(fn, *args)
+
+def _real(value):
+    if isinstance(value, complex):
+        raise ValueError("result is not a real number")
+    return value
+
+def _compact(value):
+    """Return huge integers as scientific notation + digit count + leading/trailing digits."""
+    if not isinstance(value, int) or value == 0:
+        return value
+    log10 = math.log10(abs(value))
+    digits = int(log10) + 1
+    if digits <= MAX_OUTPUT_DIGITS:
+        return value
+    exponent = int(log10)
+    mantissa = 10 ** (log10 - exponent)
+    sign = "-" if value < 0 else ""
+    trailing = str(abs(value) % 10 ** 20).zfill(20)
+    return f"{sign}{mantissa:.15f}e+{exponent} ({digits} digits; last 20 digits: {trailing})"
 
 @mcp.tool()
 def add(a:int,b:int)->int:
@@ -31,10 +145,14 @@ def divide(a: int, b: int) -> float:
     return a / b
 
 # Raise a to the power of b
+def _power(a: int, b: int) -> int:
+    # A negative base with a fractional exponent gives a complex number in Python
+    return _real(_guarded("power", operator.pow, a, b))
+
 @mcp.tool()
-def power(a: int, b: int) -> int:
+async def power(a: int, b: int) -> int | str:
     """Raise a to the power of b"""
-    return a ** b
+    return _compact(await _call("power", _power, a, b))
 
 # Advanced math tool functions
 @mcp.tool()
@@ -73,32 +191,35 @@ def lcm(a: int, b: int) -> int:
     except AttributeError:
         return abs(a * b) // math.gcd(a, b)
 
-@mcp.tool()
-def factorial(n: int) -> int:
-    """n! for non-negative integer n."""
+def _factorial(n: int) -> int:
     if n < 0:
         raise ValueError("factorial domain error: n must be >= 0.")
-    return math.factorial(n)
+    return _guarded("factorial", math.factorial, n)
 
-@mcp.tool()
-def nCr(n: int, r: int) -> int:
-    """Combination: n choose r."""
+def _nCr(n: int, r: int) -> int:
     if n < 0 or r < 0 or r > n:
         raise ValueError("nCr domain error: require n >= 0 and 0 <= r <= n.")
-    try:
-        return math.comb(n, r)  # type: ignore[attr-defined]
-    except AttributeError:
-        return factorial(n) // (factorial(r) * factorial(n - r))
+    return _guarded("nCr", math.comb, n, r)
 
-@mcp.tool()
-def nPr(n: int, r: int) -> int:
-    """Permutation: n P r."""
+def _nPr(n: int, r: int) -> int:
     if n < 0 or r < 0 or r > n:
         raise ValueError("nPr domain error: require n >= 0 and 0 <= r <= n.")
-    try:
-        return math.perm(n, r)  # type: ignore[attr-defined]
-    except AttributeError:
-        return factorial(n) // factorial(n - r)
+    return _guarded("nPr", math.perm, n, r)
+
+@mcp.tool()
+async def factorial(n: int) -> int | str:
+    """n! for non-negative integer n. Very large results come back as scientific notation + digit count."""
+    return _compact(await _call("factorial", _factorial, n))
+
+@mcp.tool()
+async def nCr(n: int, r: int) -> int | str:
+    """Combination: n choose r."""
+    return _compact(await _call("nCr", _nCr, n, r))
+
+@mcp.tool()
+async def nPr(n: int, r: int) -> int | str:
+    """Permutation: n P r."""
+    return _compact(await _call("nPr", _nPr, n, r))
 
 @mcp.tool()
 def sin(x: float) -> float:
@@ -150,9 +271,251 @@ def round_num(x: float, ndigits: int = 0) -> float:
     """Round x to `ndigits` decimal places (default 0)."""
     return round(x, ndigits)
 
+# Vectorized variants: one call over a whole list of values, computed with NumPy.
+# Each entry: (function over a float array, domain-error mask or None, domain error message)
+_ARRAY_FUNCS = None
+
+def _array_funcs() -> dict:
+    # NumPy is imported on first use to keep server start-up fast
+    global _ARRAY_FUNCS
+    if _ARRAY_FUNCS is None:
+        import numpy as np
+        _ARRAY_FUNCS = {
+            "sin": (np.sin, None, None),
+            "cos": (np.cos, None, None),
+            "tan": (np.tan, None, None),
+            "sin_deg": (lambda a: np.sin(np.radians(a)), None, None),
+            "cos_deg": (lambda a: np.cos(np.radians(a)), None, None),
+            "tan_deg": (lambda a: np.tan(np.radians(a)), None, None),
+            "sqrt": (np.sqrt, lambda a: a < 0, "sqrt domain error: x must be >= 0."),
+            "log": (np.log, lambda a: a <= 0, "log domain error: x must be > 0."),
+            "exp": (np.exp, None, None),
+            "abs_val": (np.abs, None, None),
+            "floor": (np.floor, None, None),
+            "ceil": (np.ceil, None, None),
+            "round_num": (np.round, None, None),
+        }
+    return _ARRAY_FUNCS
+
+@mcp.tool()
+def array_apply(function: str, values: list[float], base: float = math.e, ndigits: int = 0) -> dict:
+    """
+    Apply an elementwise math function to every value in one call.
+    `function` is one of: sin, cos, tan, sin_deg, cos_deg, tan_deg, sqrt, log, exp, abs_val, floor, ceil, round_num.
+    `base` is used by log, `ndigits` by round_num.
+    Returns {"results": [...], "errors": {index: message}}; elements with a domain error
+    (e.g. sqrt of a negative) are null in "results" and the rest are still computed.
+    """
+    import numpy as np
+    funcs = _array_funcs()
+    if function not in funcs:
+        raise ValueError(f"Unknown function '{function}'. Available: {', '.join(funcs)}.")
+    if function == "log" and (base <= 0 or base == 1):
+        raise ValueError("log domain error: base must be > 0 and != 1.")
+    fn, domain, domain_msg = funcs[function]
+    arr = np.asarray(values, dtype=float)
+    bad = domain(arr) if domain else np.zeros(arr.shape, dtype=bool)
+    out = np.full(arr.shape, np.nan)
+    with np.errstate(all="ignore"):
+        if function == "round_num":
+            out[~bad] = np.round(arr[~bad], ndigits)
+        else:
+            out[~bad] = fn(arr[~bad])
+        if function == "log" and base != math.e:
+            out[~bad] /= np.log(base)
+    overflow = ~bad & ~np.isfinite(out)
+    errors = {int(i): domain_msg for i in np.flatnonzero(bad)}
+    errors.update({int(i): f"{function} result is not finite for x={arr[i]}." for i in np.flatnonzero(overflow)})
+    as_int = function in ("floor", "ceil")
+    results = [
+        None if i in errors else (int(v) if as_int else float(v))
+        for i, v in enumerate(out.tolist())
+    ]
+    return {"results": results, "errors": errors}
+
+@mcp.tool()
+def array_reduce(op: str, values: list[float], other: list[float] | None = None,
+                 q: list[float] | None = None, ddof: int = 0) -> float | list[float]:
+    """
+    Reduce a list of values in one call. `op` is one of:
+      sum, mean, min, max, variance, stddev (population by default; ddof=1 for sample),
+      median, percentile (with `q`, e.g. [25, 50, 95]), dot (with `other`, same length as values).
+    """
+    import numpy as np
+    arr = np.asarray(values, dtype=float)
+    if arr.size == 0:
+        raise ValueError("values must not be empty.")
+    if op == "sum":
+        return float(np.sum(arr))
+    if op == "mean":
+        return float(np.mean(arr))
+    if op == "min":
+        return float(np.min(arr))
+    if op == "max":
+        return float(np.max(arr))
+    if op in ("variance", "stddev"):
+        if arr.size <= ddof:
+            raise ValueError(f"{op} needs more than {ddof} value(s) for ddof={ddof}.")
+        return float(np.var(arr, ddof=ddof) if op == "variance" else np.std(arr, ddof=ddof))
+    if op == "median":
+        return float(np.median(arr))
+    if op == "percentile":
+        if not q:
+            raise ValueError("percentile requires `q`, e.g. [25, 50, 75].")
+        if any(p < 0 or p > 100 for p in q):
+            raise ValueError("percentile domain error: q must be within [0, 100].")
+        return [float(v) for v in np.percentile(arr, q)]
+    if op == "dot":
+        if other is None or len(other) != arr.size:
+            raise ValueError("dot requires `other` with the same length as `values`.")
+        return float(np.dot(arr, np.asarray(other, dtype=float)))
+    raise ValueError(f"Unknown op '{op}'. Available: sum, mean, min, max, variance, stddev, median, percentile, dot.")
+
+# Expression evaluation over the tools above (safe AST walk, no eval)
+_FUNCS = {
+    f.__name__: f for f in (
+        add, multiple, subtract, divide, sqrt, log, exp, gcd, lcm,
+        sin, cos, tan, sin_deg, cos_deg, tan_deg, abs_val, floor, ceil, round_num,
+    )
+}
+# Cost-guarded blocking versions of the big-integer tools
+_FUNCS.update({"power": _power, "factorial": _factorial, "nCr": _nCr, "nPr": _nPr})
+_FUNCS.update({"abs": abs_val, "round": round_num, "multiply": multiple, "ln": log})
+_CONSTS = {"pi": math.pi, "e": math.e, "tau": math.tau}
+_BIN_OPS = {
+    ast.Add: add, ast.Sub: subtract, ast.Mult: multiple, ast.Div: divide, ast.Pow: _power,
+    ast.Mod: operator.mod, ast.FloorDiv: operator.floordiv,
+}
+_UNARY_OPS = {ast.UAdd: operator.pos, ast.USub: operator.neg}
+
+def _eval(node, names: dict):
+    if isinstance(node, ast.Expression):
+        return _eval(node.body, names)
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        return node.value
+    if isinstance(node, ast.Name):
+        if node.id in names:
+            return names[node.id]
+        raise ValueError(f"Unknown name '{node.id}'.")
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPS:
+        return _UNARY_OPS[type(node.op)](_eval(node.operand, names))
+    if isinstance(node, ast.BinOp) and type(node.op) in _BIN_OPS:
+        return _BIN_OPS[type(node.op)](_eval(node.left, names), _eval(node.right, names))
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+        fn = _FUNCS.get(node.func.id)
+        if fn is None:
+            raise ValueError(f"Unknown function '{node.func.id}'. Available: {', '.join(sorted(_FUNCS))}.")
+        args = [_eval(a, names) for a in node.args]
+        kwargs = {k.arg: _eval(k.value, names) for k in node.keywords if k.arg}
+        return fn(*args, **kwargs)
+    raise ValueError(f"Unsupported syntax in expression: {type(node).__name__}.")
+
+def _evaluate(expression: str, names: dict | None = None):
+    expr = expression.strip().replace("×", "*").replace("÷", "/").replace("^", "**")
+    # "3 x 4" style multiplication (an x between numbers/parentheses)
+    expr = re.sub(r"(?<=[\d)])\s*x\s*(?=[\d(])", " * ", expr)
+    try:
+        tree = ast.parse(expr, mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"Could not parse expression: {e.msg}.")
+    value = _real(_eval(tree, {**_CONSTS, **(names or {})}))
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return int(value)
+    return value
+
+@mcp.tool()
+async def evaluate(expression: str) -> int | float | str:
+    """
+    Evaluate a whole math expression in one call, e.g. "(3 + 5) * 12" or "sqrt(16) + log(8, 2) * sin_deg(30)".
+    Supports + - * / // % ** (or ^), parentheses, the constants pi/e/tau and every math tool
+    on this server as a function (add, multiple, sqrt, log, factorial, nCr, sin_deg, round_num, ...).
+    """
+    # Runs in a thread: big-integer steps inside the expression may wait on the worker process
+    return _compact(await asyncio.to_thread(_evaluate, expression))
+
+@mcp.tool()
+async def batch(ops: list[dict]) -> dict:
+    """
+    Run several dependent math operations in one call. Each op is a dict with an "id" and either
+      - "op" (a tool name) and "args" (list, or dict of keyword args), or
+      - "expr" (an expression as accepted by `evaluate`).
+    Args and expressions may reference other ops' results: "$id" in args, or the bare id in "expr".
+    Example: [{"id": "a", "op": "add", "args": [3, 5]}, {"id": "b", "expr": "a * 12"}]
+    Ops run in dependency order. Returns {"results": {id: value}, "errors": {id: message}};
+    an op that fails (or depends on one that failed) is reported in "errors" only.
+    """
+    return await asyncio.to_thread(_run_batch, ops)
+
+def _run_batch(ops: list[dict]) -> dict:
+    by_id = {}
+    for i, op in enumerate(ops):
+        by_id[str(op.get("id", i))] = op
+    results, errors = {}, {}
+    visiting = set()
+
+    def resolve_arg(value):
+        if isinstance(value, str) and value.startswith("$"):
+            return resolve(value[1:])
+        return value
+
+    def resolve(op_id: str):
+        if op_id in results:
+            return results[op_id]
+        if op_id in errors:
+            raise ValueError(f"depends on failed op '{op_id}'")
+        if op_id not in by_id:
+            raise ValueError(f"unknown op id '{op_id}'")
+        if op_id in visiting:
+            raise ValueError(f"dependency cycle at '{op_id}'")
+        visiting.add(op_id)
+        op = by_id[op_id]
+        try:
+            if "expr" in op:
+                expr = str(op["expr"])
+                refs = {n.id for n in ast.walk(ast.parse(expr.replace("^", "**"), mode="eval"))
+                        if isinstance(n, ast.Name) and n.id in by_id and n.id != op_id}
+                value = _evaluate(expr, {r: resolve(r) for r in refs})
+            else:
+                fn = _FUNCS.get(op.get("op", ""))
+                if fn is None:
+                    raise ValueError(f"unknown op '{op.get('op')}'")
+                args = op.get("args", [])
+                if isinstance(args, dict):
+                    value = fn(**{k: resolve_arg(v) for k, v in args.items()})
+                else:
+                    value = fn(*[resolve_arg(a) for a in args])
+            results[op_id] = value
+            return value
+        except Exception as e:
+            errors.setdefault(op_id, str(e))
+            raise ValueError(f"depends on failed op '{op_id}'")
+        finally:
+            visiting.discard(op_id)
+
+    for op_id in by_id:
+        try:
+            resolve(op_id)
+        except ValueError:
+            pass
+    return {"results": {k: _compact(v) for k, v in results.items()}, "errors": errors}
+
 #The transport="stdio" argument tells the server to:
 
 #Use standard input/output (stdin and stdout) to receive and respond to tool function calls.
 
 if __name__=="__main__":
-    mcp.run(transport="stdio")
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--transport", choices=["stdio", "streamable-http"], default="stdio")
+    parser.add_argument("--port", type=int, default=8001, help="Port for streamable-http")
+    parser.add_argument("--profile-startup", action="store_true", help="Report import times and time to MCP-ready, then exit")
+    args = parser.parse_args()
+
+    if args.profile_startup:
+        from startup import profile_startup
+        profile_startup(__file__)
+        raise SystemExit(0)
+
+    mcp.settings.port = args.port
+    mcp.run(transport=args.transport)
\ No newline at end of file
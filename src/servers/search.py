@@ -1,9 +1,63 @@
-from mcp.server.fastmcp import FastMCP
-from ddgs import DDGS
-from markitdown import MarkItDown
-import sys, re
+from mcp.server.fastmcp import FastMCP, Context
+from concurrent.futures import ThreadPoolExecutor
+from cache import SQLiteCache, SingleFlight
+from tracing import instrument, in_context, span
+import sys, re, os, io, asyncio, threading, time, math, hashlib
+from collections import Counter
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 
 mcp = FastMCP("Search")
+instrument(mcp, "search")
+
+# Page fetch/convert is blocking (requests + MarkItDown), so it runs on a bounded
+# thread pool instead of the event loop. Deadlines are in seconds.
+FETCH_WORKERS = int(os.getenv("SEARCH_FETCH_WORKERS", "6"))
+FETCH_TIMEOUT = float(os.getenv("SEARCH_FETCH_TIMEOUT", "8"))
+SEARCH_DEADLINE = float(os.getenv("SEARCH_DEADLINE", "15"))
+
+# Pages are streamed with a byte cap and only text-like content types are converted.
+# HTML reading also stops early once it holds roughly TEXT_TARGET chars of visible text.
+MAX_FETCH_BYTES = int(os.getenv("SEARCH_MAX_FETCH_BYTES", str(2 * 1024 * 1024)))
+TEXT_TARGET = int(os.getenv("SEARCH_TEXT_TARGET", "50000"))
+FETCH_CHUNK = 64 * 1024
+ALLOWED_TYPES = ("text/html", "application/xhtml+xml", "text/plain", "text/markdown")
+USER_AGENT = "Mozilla/5.0 (compatible; mcp-chatbot search)"
+
+# Two-level on-disk cache: normalized query -> ranked (title, url) list, and url -> page text.
+# TTLs are in seconds; set SEARCH_CACHE=0 to disable.
+SEARCH_CACHE = os.getenv("SEARCH_CACHE", "1") != "0"
+RESULTS_TTL = float(os.getenv("SEARCH_RESULTS_TTL", str(60 * 60)))
+PAGES_TTL = float(os.getenv("SEARCH_PAGES_TTL", str(24 * 60 * 60)))
+PAGE_TEXT_CAP = 200_000  # chars of stripped text kept per cached page
+
+_results_cache = SQLiteCache("search_results", RESULTS_TTL, max_entries=2000) if SEARCH_CACHE else None
+_pages_cache = SQLiteCache("search_pages", PAGES_TTL, max_entries=5000, max_bytes=256 * 1024 * 1024) if SEARCH_CACHE else None
+_inflight = SingleFlight()
+
+# Passage selection: pages are split into ~PASSAGE_CHARS passages and ranked against the
+# query with BM25, so the per-page budget holds the relevant text rather than page headers.
+PASSAGE_CHARS = 500
+MIN_PASSAGE_CHARS = 120
+BM25_K1 = 1.5
+BM25_B = 0.75
+_STOPWORDS = set(
+    "a an and are as at be by for from has have how i in is it its of on or that the this to was were "
+    "what when where which who why will with about does do did can you your".split()
+)
+
+# Near-duplicate handling: result URLs are canonicalized before fetching (mirrors, AMP
+# pages, tracking params), and fetched text is fingerprinted with a 64-bit SimHash over
+# word shingles; a page within SIMHASH_MAX_DISTANCE bits of a better-ranked one is dropped.
+SIMHASH_MAX_DISTANCE = 3
+SHINGLE_WORDS = 3
+FINGERPRINT_CHARS = 20_000  # mirrors match from the top; fingerprint a prefix only
+_TRACKING_PARAM = re.compile(r"^(utm_\w+|fbclid|gclid|dclid|mc_cid|mc_eid|igshid|ref|ref_src|amp|outputtype|_ga)$", re.I)
+_dedup = Counter()  # running totals for the dedup log line
+
+_fetch_pool = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="search-fetch")
+# One slot per fetch thread, so a page's FETCH_TIMEOUT starts when a thread takes it, not while queued
+_fetch_slots: asyncio.Semaphore | None = None
+_local = threading.local()
 
 def _log(msg: str):
     # stderr only so we don't break stdio transport
@@ -30,18 +84,334 @@ def _strip_links(md_text: str) -> str:
     text = re.sub(r'\n{3,}', '\n\n', text).strip()
     return text
 
+# ddgs, markitdown and requests are imported on first use to keep server start-up fast.
+
+def _markitdown():
+    # One converter and one keep-alive HTTP session per worker thread
+    md = getattr(_local, "md", None)
+    if md is None:
+        from markitdown import MarkItDown
+        md = _local.md = MarkItDown()
+    return md
+
+def _session():
+    session = getattr(_local, "session", None)
+    if session is None:
+        import requests
+        session = _local.session = requests.Session()
+        session.headers["User-Agent"] = USER_AGENT
+    return session
+
+_TAG_RE = re.compile(r"<(script|style)\b.*?</\1\s*>|<[^>]*>", re.S | re.I)
+
+def _visible_chars(html: str) -> int:
+    """Cheap estimate of the visible text in an HTML prefix (tags, scripts and whitespace removed)."""
+    return len(re.sub(r"\s+", " ", _TAG_RE.sub(" ", html)))
+
+def _download(url: str, deadline: float) -> tuple[bytes, str, str | None]:
+    """
+    Stream `url` into memory and return (body, mimetype, charset). Stops at MAX_FETCH_BYTES,
+    at `deadline` (time.monotonic()), or once an HTML page has ~TEXT_TARGET visible chars.
+    Raises ValueError for content types we don't convert.
+    """
+    with _session().get(url, stream=True, timeout=(5, FETCH_TIMEOUT)) as resp:
+        resp.raise_for_status()
+        ctype = resp.headers.get("Content-Type", "")
+        mimetype = ctype.split(";")[0].strip().lower() or "text/html"
+        if mimetype not in ALLOWED_TYPES:
+            raise ValueError(f"skipped content type {mimetype} ({resp.headers.get('Content-Length', '?')} bytes)")
+        charset = resp.encoding if "charset" in ctype.lower() else None
+        buf = bytearray()
+        checked = 0
+        for chunk in resp.iter_content(FETCH_CHUNK):
+            buf += chunk
+            if len(buf) >= MAX_FETCH_BYTES or time.monotonic() > deadline:
+                break
+            # Re-check visible text every ~128KB so the estimate stays cheap
+            if len(buf) - checked >= 2 * FETCH_CHUNK:
+                checked = len(buf)
+                visible = len(buf) if mimetype != "text/html" else _visible_chars(buf.decode(charset or "utf-8", "ignore"))
+                if visible >= TEXT_TARGET:
+                    break
+        return bytes(buf[:MAX_FETCH_BYTES]), mimetype, charset
+
+def _tokenize(text: str) -> list[str]:
+    return [w for w in re.findall(r"[a-z0-9]+", text.lower()) if w not in _STOPWORDS]
+
+def _passages(text: str) -> list[str]:
+    """Split stripped page text into passages of roughly PASSAGE_CHARS, on line/sentence boundaries."""
+    pieces = []
+    for line in text.split("\n"):
+        line = line.strip()
+        if len(line) <= PASSAGE_CHARS:
+            pieces.append(line)
+        else:
+            pieces += re.split(r"(?<=[.!?])\s+", line)
+    passages, cur = [], ""
+    for piece in pieces:
+        # Blank lines end a passage once it is long enough to stand alone
+        if not piece:
+            if len(cur) >= MIN_PASSAGE_CHARS:
+                passages.append(cur)
+                cur = ""
+            continue
+        if cur and len(cur) + len(piece) + 1 > PASSAGE_CHARS:
+            passages.append(cur)
+            cur = ""
+        cur = f"{cur} {piece}" if cur else piece
+    if cur:
+        passages.append(cur)
+    return passages
+
+def _select_passages(query: str, pages: dict[int, str], budget: int) -> dict[int, str]:
+    """
+    Rank every page's passages against `query` with BM25 (IDF over all fetched passages)
+    and keep each page's best passages up to `budget` chars, in document order.
+    Pages where no passage matches the query keep their leading text; passages already
+    seen on a better-ranked page don't count as matches.
+    """
+    split = {rank: _passages(pages[rank]) for rank in sorted(pages)}
+    docs = [(rank, i, _tokenize(p)) for rank, ps in split.items() for i, p in enumerate(ps)]
+    if not docs:
+        return {}
+    n = len(docs)
+    avgdl = sum(len(toks) for _, _, toks in docs) / n or 1
+    df = Counter(t for _, _, toks in docs for t in set(toks))
+    terms = set(_tokenize(query))
+    scores: dict[int, list[tuple[float, int]]] = {rank: [] for rank in split}
+    first_seen: dict[tuple, int] = {}
+    for rank, i, toks in docs:
+        # A passage repeated verbatim from a better-ranked page (syndicated copy, shared boilerplate) is skipped
+        if first_seen.setdefault(tuple(toks), rank) != rank:
+            continue
+        tf = Counter(toks)
+        score = 0.0
+        for t in terms & tf.keys():
+            idf = math.log(1 + (n - df[t] + 0.5) / (df[t] + 0.5))
+            score += idf * tf[t] * (BM25_K1 + 1) / (tf[t] + BM25_K1 * (1 - BM25_B + BM25_B * len(toks) / avgdl))
+        scores[rank].append((score, i))
+
+    out = {}
+    for rank, ps in split.items():
+        ranked = sorted((si for si in scores[rank] if si[0] > 0), key=lambda si: (-si[0], si[1]))
+        if not ranked:
+            out[rank] = pages[rank]
+            continue
+        keep, used = [], 0
+        for _, i in ranked:
+            if used + len(ps[i]) > budget and keep:
+                continue
+            keep.append(i)
+            used += len(ps[i]) + 3
+            if used >= budget:
+                break
+        out[rank] = " … ".join(ps[i] for i in sorted(keep))
+    return out
+
+def _canonical_url(url: str) -> str:
+    """Collapse URL variants of one page: scheme, www./m./amp. hosts, AMP paths, tracking params, fragments."""
+    parts = urlsplit(url.strip())
+    host = re.sub(r"^(www\d*|m|mobile|amp)\.", "", (parts.hostname or "").lower())
+    if parts.port and parts.port not in (80, 443):
+        host += f":{parts.port}"
+    path = re.sub(r"/amp(?=/|$)", "", parts.path)
+    path = re.sub(r"\.amp(\.html?)$", r"\1", path).rstrip("/") or "/"
+    query = urlencode(sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                             if not _TRACKING_PARAM.match(k)))
+    scheme = "https" if parts.scheme in ("http", "https") else parts.scheme
+    return urlunsplit((scheme, host, path, query, ""))
+
+def _dedupe_results(results: list[tuple[str, str]]) -> tuple[list[tuple[str, str]], int]:
+    """Keep the best-ranked result per canonical URL; returns (results, number dropped)."""
+    seen, kept = set(), []
+    for title, url in results:
+        key = _canonical_url(url)
+        if key not in seen:
+            seen.add(key)
+            kept.append((title, url))
+    return kept, len(results) - len(kept)
+
+def _simhash(text: str) -> int:
+    """64-bit SimHash of the word shingles in the first FINGERPRINT_CHARS of `text`."""
+    words = re.findall(r"[a-z0-9]+", text[:FINGERPRINT_CHARS].lower())
+    shingles = Counter(" ".join(words[i:i + SHINGLE_WORDS]) for i in range(max(1, len(words) - SHINGLE_WORDS + 1)))
+    weights = [0] * 64
+    for shingle, count in shingles.items():
+        h = int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += count if h >> bit & 1 else -count
+    return sum(1 << bit for bit, w in enumerate(weights) if w > 0)
+
+def _near_duplicate(a: int, b: int) -> bool:
+    return (a ^ b).bit_count() <= SIMHASH_MAX_DISTANCE
+
+def _normalize_query(query: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation so near-identical queries share a cache key."""
+    q = re.sub(r"\s+", " ", (query or "").lower()).strip()
+    return re.sub(r"[\s.?!]+$", "", q)
+
+def _ddgs_results(query: str, mr: int) -> list[tuple[str, str]]:
+    """Blocking DDGS lookup -> up to `mr * 2` ranked (title, url) pairs."""
+    from ddgs import DDGS
+    results = []
+    with DDGS() as ddg:
+        for r in ddg.text(query, region="us-en", safesearch="moderate", max_results=mr * 5):
+            title = (r.get("title") or r.get("title_full") or "").strip()
+            href = (r.get("href") or r.get("link") or r.get("url") or "").strip()
+            if title and href:
+                results.append((title, href))
+            if len(results) >= mr * 2:
+                break
+    return results
+
+def _fetch_text(url: str) -> str:
+    """Blocking byte-capped fetch + convert of one page -> stripped plain text."""
+    from markitdown import StreamInfo
+    with span("page.fetch", url=url) as attrs:
+        body, mimetype, charset = _download(url, time.monotonic() + FETCH_TIMEOUT)
+        attrs.update(bytes=len(body), mimetype=mimetype)
+    with span("page.convert", url=url) as attrs:
+        info = StreamInfo(mimetype=mimetype, charset=charset, url=url,
+                          extension=".html" if "html" in mimetype else ".txt")
+        doc = _markitdown().convert_stream(io.BytesIO(body), stream_info=info)
+        raw = (getattr(doc, "text_content", "") or "").strip()
+        text = _strip_links(raw)[:PAGE_TEXT_CAP]
+        attrs["chars"] = len(text)
+    _log(f"Fetched {len(body)} bytes ({mimetype}) from {url}, used {len(text.encode())} bytes of text")
+    return text
+
+async def _fetch_texts(urls: list[str], want: int, on_page=None) -> tuple[dict[int, str], dict[int, str]]:
+    """
+    Fetch pages concurrently on the worker pool and return ({rank: text}, {rank: text})
+    for the distinct pages and for the near-duplicates of a better-ranked page.
+    Returns as soon as the first `want` distinct pages in rank order are known, or
+    when SEARCH_DEADLINE expires; the rest are cancelled.
+    Pages already in the page cache are not fetched again.
+    `on_page(rank, text)` is awaited for each usable, not yet seen page as soon as it is available.
+    """
+    global _fetch_slots
+    if _fetch_slots is None:
+        _fetch_slots = asyncio.Semaphore(FETCH_WORKERS)
+    loop = asyncio.get_running_loop()
+    texts: dict[int, str] = {}
+    fingerprints: dict[int, int] = {}
+    done_ranks: set[int] = set()
+    if _pages_cache is not None:
+        for rank, url in enumerate(urls):
+            cached = _pages_cache.get(url)
+            if cached:
+                texts[rank] = cached
+                done_ranks.add(rank)
+    if texts:
+        hashed = await asyncio.gather(*(loop.run_in_executor(_fetch_pool, _simhash, t) for t in texts.values()))
+        fingerprints.update(zip(texts, hashed))
+
+    def duplicates() -> set[int]:
+        # In rank order, so the better-ranked copy is the one kept
+        kept, dups = [], set()
+        for rank in sorted(texts):
+            if any(_near_duplicate(fingerprints[rank], fingerprints[k]) for k in kept):
+                dups.add(rank)
+            else:
+                kept.append(rank)
+        return dups
+
+    def ready() -> bool:
+        # Done once every rank up to the `want`-th distinct page has resolved.
+        usable = 0
+        dups = duplicates()
+        for rank in range(len(urls)):
+            if rank not in done_ranks:
+                return False
+            if rank in texts and rank not in dups:
+                usable += 1
+                if usable >= want:
+                    return True
+        return True
+
+    async def one(url: str) -> tuple[str, int]:
+        start = time.perf_counter()
+        try:
+            async with _fetch_slots:
+                text = await asyncio.wait_for(loop.run_in_executor(_fetch_pool, in_context(_fetch_text, url)), FETCH_TIMEOUT)
+            if not text:
+                return "", 0
+            if _pages_cache is not None:
+                _pages_cache.set(url, text)
+            return text, await loop.run_in_executor(_fetch_pool, _simhash, text)
+        except asyncio.TimeoutError:
+            _log(f"Content fetch timed out for {url} after {FETCH_TIMEOUT:.0f}s")
+        except Exception as fe:
+            _log(f"Content fetch skipped for {url}: {fe}")
+        finally:
+            _log(f"Fetch finished for {url} in {time.perf_counter() - start:.2f}s")
+        return "", 0
+
+    emitted: list[int] = []
+
+    async def emit(rank: int) -> None:
+        if on_page is None or any(_near_duplicate(fingerprints[rank], fp) for fp in emitted):
+            return
+        emitted.append(fingerprints[rank])
+        await on_page(rank, texts[rank])
+
+    def result() -> tuple[dict[int, str], dict[int, str]]:
+        dups = duplicates()
+        return ({r: t for r, t in texts.items() if r not in dups}, {r: texts[r] for r in sorted(dups)})
+
+    for rank in sorted(texts):
+        await emit(rank)
+    if ready():
+        return result()
+    tasks = {asyncio.ensure_future(one(u)): i for i, u in enumerate(urls) if i not in done_ranks}
+    deadline = loop.time() + SEARCH_DEADLINE
+    pending = set(tasks)
+    try:
+        while pending:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                _log(f"Search deadline hit with {len(pending)} page(s) still pending")
+                break
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                rank = tasks[t]
+                done_ranks.add(rank)
+                text, fingerprint = t.result()
+                if text:
+                    texts[rank] = text
+                    fingerprints[rank] = fingerprint
+                    await emit(rank)
+            if ready():
+                return result()
+    finally:
+        for t in pending:
+            t.cancel()
+    return result()
+
+def _block(title: str, text: str, content_chars: int) -> str:
+    block = [title]  # plain title line
+    if text:
+        if len(text) > content_chars:
+            text = text[: content_chars - 1].rstrip() + "…"
+        block += ["", text]
+    return "\n".join([b for b in block if b])
+
 @mcp.tool()
-async def web_search(query: str, max_results: int = 5, include_content: bool | int = True) -> str:
+async def web_search(query: str, max_results: int = 5, include_content: bool | int = True,
+                     ctx: Context = None) -> str:
     """
     Minimal web search:
       - DDGS top results
       - MarkItDown -> Markdown
       - Strip links -> plain text
+      - Keep the passages that best match the query (BM25)
       - Return up to `max_results` blocks (default 1)
     `include_content`:
-      - True -> include ~1200 chars per page
+      - True -> include ~1200 chars (~300 tokens) of the most relevant passages per page
       - False/0 -> just the title (no page fetch)
       - int -> that many chars per page (cap ~4000)
+    Each page's block is also sent as a progress notification as soon as it is ready,
+    so callers can start working before the whole result is returned.
     """
     _log(f"Searching: {query} (max_results={max_results}, include_content={include_content})")
 
@@ -59,49 +429,82 @@ async def web_search(query: str, max_results: int = 5, include_content: bool | i
             content_chars = 1200
     content_chars = max(0, min(content_chars, 4000))
 
-    # 1) get top results
-    results = []
-    try:
-        with DDGS() as ddg:
-            for r in ddg.text(query, region="us-en", safesearch="moderate", max_results=mr * 5):
-                title = (r.get("title") or r.get("title_full") or "").strip()
-                href = (r.get("href") or r.get("link") or r.get("url") or "").strip()
-                if title and href:
-                    results.append((title, href))
-                if len(results) >= mr * 2:
-                    break
-    except Exception as e:
-        return f"Search error: {e}"
+    on_block = None
+    if ctx is not None:
+        sent = 0
+
+        async def on_block(block: str):
+            nonlocal sent
+            sent += 1
+            try:
+                await ctx.report_progress(sent, mr, message=block)
+            except Exception as pe:
+                _log(f"Progress notification failed: {pe}")
+
+    # Identical concurrent searches share one in-flight run (progress goes to the first caller)
+    key = f"{_normalize_query(query)}|{mr}|{content_chars}"
+    return await _inflight.do(key, lambda: _search(query, mr, content_chars, on_block))
+
+async def _search(query: str, mr: int, content_chars: int, on_block=None) -> str:
+    # 1) get top results (cached; DDGS is blocking, keep it off the event loop)
+    rkey = f"{_normalize_query(query)}|{mr}"
+    results = _results_cache.get(rkey) if _results_cache is not None else None
+    if results is None:
+        try:
+            with span("search.results", query=query):
+                results = await asyncio.to_thread(_ddgs_results, query, mr)
+        except Exception as e:
+            return f"Search error: {e}"
+        if results and _results_cache is not None:
+            _results_cache.set(rkey, results)
 
     if not results:
         return "No results found."
+    # Mirrors, AMP copies and tracking-param variants of one URL are only fetched once
+    results, url_dups = _dedupe_results(results)
 
-    # 2) fetch & convert
-    md = MarkItDown()
-    out = []
-    fetched = 0
-    for title, url in results:
-        block = [title]  # plain title line
+    # 2) fetch & convert concurrently; pages that fail or repeat a better-ranked page are
+    #    replaced by the next ranked result
+    on_page = None
+    if on_block is not None:
+        async def on_page(rank: int, text: str):
+            # Single-page passage selection; the final result re-ranks across all pages
+            selected = _select_passages(query, {rank: text}, content_chars).get(rank, "")
+            await on_block(_block(results[rank][0], selected, content_chars))
 
-        if content_chars > 0 and fetched < mr:
-            try:
-                doc = md.convert(url)
-                raw = (getattr(doc, "text_content", "") or "").strip()
-                text = _strip_links(raw)
-                if text:
-                    if len(text) > content_chars:
-                        text = text[: content_chars - 1].rstrip() + "…"
-                    block += ["", text]
-                    fetched += 1
-            except Exception as fe:
-                _log(f"Content fetch skipped for {url}: {fe}")
+    with span("search.pages", pages=len(results)) as attrs:
+        texts, dups = await _fetch_texts([url for _, url in results], mr, on_page) if content_chars > 0 else ({}, {})
+        attrs.update(url_dups=url_dups, content_dups=len(dups))
+    ranks = sorted(texts)[:mr]
+    # 3) keep the passages most relevant to the query within the per-page budget
+    if ranks:
+        full = {i: texts[i] for i in ranks}
+        with span("search.passages"):
+            texts = _select_passages(query, full, content_chars)
+        _log(f"Passage selection: {sum(min(len(t), content_chars) for t in texts.values())} of "
+             f"{sum(len(t) for t in full.values())} page chars kept")
+    # Top up with title-only blocks (in rank order) if too few pages produced text
+    ranks += [i for i in range(len(results)) if i not in texts and i not in dups][: mr - len(ranks)]
+    out = [_block(results[i][0], texts.get(i, ""), content_chars) for i in sorted(ranks)]
 
-        out.append("\n".join([b for b in block if b]))
-        if len(out) >= mr:
-            break
+    # Each dropped duplicate would have cost up to a page budget of summarizer input (~4 chars/token)
+    saved = url_dups * content_chars + sum(min(len(t), content_chars) for t in dups.values())
+    _dedup.update(results=len(results) + url_dups, url=url_dups, content=len(dups), chars=saved)
+    if url_dups or dups:
+        _log(f"Dedup: {url_dups} duplicate URL(s), {len(dups)} near-duplicate page(s) dropped, "
+             f"~{saved // 4} tokens saved; {(_dedup['url'] + _dedup['content']) / _dedup['results']:.0%} of "
+             f"{_dedup['results']} results duplicated so far (~{_dedup['chars'] // 4} tokens saved)")
 
+    if _results_cache is not None:
+        _log("Cache stats: " + ", ".join(
+            f"{st['name']} {st['hits']}/{st['hits'] + st['misses']} hits" for st in cache_stats()
+        ) + f", {_inflight.shared} shared in-flight")
     return "\n\n---\n\n".join(out)
 
+def cache_stats() -> list[dict]:
+    """Hit/miss counters and size for each search cache level."""
+    return [c.stats() for c in (_results_cache, _pages_cache) if c is not None]
+
 if __name__ == "__main__":
     import sys
     import argparse
@@ -111,8 +514,26 @@ if __name__ == "__main__":
     parser.add_argument("query", nargs="?", help="Search query")
     parser.add_argument("--max", type=int, default=5, help="Max results")
     parser.add_argument("--content", action="store_true", help="Include page content")
+    parser.add_argument("--cache-stats", action="store_true", help="Print search cache stats and exit")
+    parser.add_argument("--clear-cache", action="store_true", help="Empty the search caches and exit")
+    parser.add_argument("--transport", choices=["stdio", "streamable-http"], default="stdio")
+    parser.add_argument("--port", type=int, default=8002, help="Port for streamable-http")
+    parser.add_argument("--profile-startup", action="store_true", help="Report import times and time to MCP-ready, then exit")
     args = parser.parse_args()
 
+    if args.profile_startup:
+        from startup import profile_startup
+        profile_startup(__file__)
+        raise SystemExit(0)
+
+    if args.cache_stats or args.clear_cache:
+        for c in (_results_cache, _pages_cache):
+            if c is not None and args.clear_cache:
+                c.clear()
+        for st in cache_stats():
+            print(st)
+        sys.exit(0)
+
     if args.query:
         # Direct run mode
         async def run_direct():
@@ -126,4 +547,5 @@ if __name__ == "__main__":
         asyncio.run(run_direct())
     else:
         # MCP server mode
-        mcp.run(transport="stdio")
\ No newline at end of file
+        mcp.settings.port = args.port
+        mcp.run(transport=args.transport)
\ No newline at end of file
@@ -0,0 +1,75 @@
+"""
+Start-up profiling for the MCP servers and the client (`--profile-startup`).
+
+Servers are profiled cold: the script is launched in a fresh interpreter with
+`-X importtime` over stdio, and we measure the time until an MCP initialize +
+list_tools round trip succeeds. Import times are aggregated per top-level module.
+"""
+import asyncio
+import importlib
+import re
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+_IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+def parse_importtime(text: str) -> dict[str, float]:
+    """Cumulative seconds per top-level package from `-X importtime` output."""
+    totals: dict[str, float] = {}
+    for line in text.splitlines():
+        m = _IMPORTTIME_RE.match(line)
+        if not m:
+            continue
+        _, cumulative, indent, name = m.groups()
+        # Only the outermost import of each package carries its full cumulative cost
+        if len(indent) == 1:
+            top = name.split(".")[0]
+            totals[top] = totals.get(top, 0.0) + int(cumulative) / 1e6
+    return totals
+
+def import_times(modules: list[str]) -> dict[str, float]:
+    """Import each module in-process, in order, and return the seconds each one added."""
+    out = {}
+    for name in modules:
+        t = time.perf_counter()
+        importlib.import_module(name)
+        out[name] = time.perf_counter() - t
+    return out
+
+async def _time_to_ready(script: Path, errlog) -> tuple[float, int]:
+    from mcp import ClientSession, StdioServerParameters
+    from mcp.client.stdio import stdio_client
+
+    params = StdioServerParameters(
+        command=sys.executable,
+        args=["-X", "importtime", str(script), "--transport", "stdio"],
+        cwd=str(script.parent),
+    )
+    t = time.perf_counter()
+    async with stdio_client(params, errlog=errlog) as (read, write):
+        async with ClientSession(read, write) as session:
+            await session.initialize()
+            tools = await session.list_tools()
+            return time.perf_counter() - t, len(tools.tools)
+
+def profile_startup(script: str | Path, top: int = 12) -> dict:
+    """Cold-start `script` as a stdio MCP server and print import times and time to MCP-ready."""
+    script = Path(script).resolve()
+    with tempfile.TemporaryFile(mode="w+") as errlog:
+        ready, n_tools = asyncio.run(_time_to_ready(script, errlog))
+        errlog.seek(0)
+        imports = parse_importtime(errlog.read())
+    report = {"script": script.name, "mcp_ready_s": round(ready, 3), "tools": n_tools,
+              "imports_s": {k: round(v, 3) for k, v in sorted(imports.items(), key=lambda kv: -kv[1])}}
+    print_report(f"{script.name} cold start", imports, {"MCP ready (initialize + list_tools)": ready}, top)
+    return report
+
+def print_report(title: str, imports: dict[str, float], milestones: dict[str, float], top: int = 12) -> None:
+    print(f"== {title} ==")
+    print(f"  imports (total {sum(imports.values()):.3f}s):")
+    for name, secs in sorted(imports.items(), key=lambda kv: -kv[1])[:top]:
+        print(f"    {secs:8.3f}s  {name}")
+    for label, secs in milestones.items():
+        print(f"  {label}: {secs:.3f}s")
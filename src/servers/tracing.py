@@ -0,0 +1,283 @@
+"""
+Lightweight tracing shared by the client and the MCP servers.
+
+Spans are written one JSON object per line to a local file (default
+~/.cache/mcp-chatbot/traces.jsonl, MCP_TRACE_FILE to override, MCP_TRACE=0 to
+disable). Past MCP_TRACE_MAX_BYTES the file is rotated to traces.jsonl.1, so at
+most about twice that is kept. The client sends the current span as a W3C `traceparent` header on
+streamable-http tool calls, and `instrument(mcp)` makes each server continue
+that trace around every tool call, so one message's spans line up across processes.
+
+    python src/servers/tracing.py [--file F] [--last N]   # p50/p95/p99 per stage and per tool
+"""
+import contextlib
+import contextvars
+import json
+import os
+import secrets
+import sys
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+try:
+    from cache import CACHE_DIR  # inside a server process (src/servers on sys.path)
+except ImportError:
+    from servers.cache import CACHE_DIR  # imported by the client as servers.tracing
+
+TRACE_ENABLED = os.getenv("MCP_TRACE", "1") != "0"
+TRACE_FILE = Path(os.getenv("MCP_TRACE_FILE", str(CACHE_DIR / "traces.jsonl")))
+TRACE_MAX_BYTES = int(os.getenv("MCP_TRACE_MAX_BYTES", str(50 * 1024 * 1024)))
+ROTATE_CHECK_EVERY = 500  # spans written between size checks
+DURATION_SAMPLES = 10_000  # most recent durations kept per span name for report()
+
+# (trace_id, span_id) of the innermost open span in this task/thread
+_current: contextvars.ContextVar[tuple[str, str] | None] = contextvars.ContextVar("trace_span", default=None)
+_service = os.path.splitext(os.path.basename(sys.argv[0] or "python"))[0]
+_lock = threading.Lock()
+_file = None
+_written = 0
+# span name -> recent durations (seconds), only kept once collect_durations() was called
+# (the client, for its exit report; long-lived servers never read them)
+_durations: dict[str, deque] | None = None
+
+def set_service(name: str) -> None:
+    global _service
+    _service = name
+
+def collect_durations() -> None:
+    """Keep recent span durations in memory for report()."""
+    global _durations
+    if _durations is None:
+        _durations = {}
+
+def recent_mean(name: str, n: int = 50) -> float | None:
+    """Mean duration of the last `n` `name` spans recorded in this process, if any."""
+    values = list(_durations.get(name, ()))[-n:] if _durations else []
+    return sum(values) / len(values) if values else None
+
+def _rotate() -> None:
+    # Several processes append to the same file: only rotate it if it is still the one we
+    # have open, otherwise another process already did and we just reopen.
+    global _file
+    try:
+        on_disk = os.stat(TRACE_FILE)
+        if os.path.samestat(on_disk, os.fstat(_file.fileno())):
+            if on_disk.st_size <= TRACE_MAX_BYTES:
+                return
+            os.replace(TRACE_FILE, TRACE_FILE.with_name(TRACE_FILE.name + ".1"))
+    except FileNotFoundError:
+        pass
+    _file.close()
+    _file = None
+
+def _export(record: dict) -> None:
+    global _file, _written
+    if _durations is not None:
+        _durations.setdefault(record["name"], deque(maxlen=DURATION_SAMPLES)).append(record["dur"])
+    if not TRACE_ENABLED:
+        return
+    line = json.dumps(record, default=str) + "\n"
+    with _lock:
+        try:
+            if _file is not None and _written % ROTATE_CHECK_EVERY == 0:
+                _rotate()
+            if _file is None:
+                TRACE_FILE.parent.mkdir(parents=True, exist_ok=True)
+                _file = open(TRACE_FILE, "a", encoding="utf-8", buffering=1)
+            _file.write(line)
+            _written += 1
+        except OSError as e:
+            print(f"[Trace] export failed: {e}", file=sys.stderr)
+
+@contextlib.contextmanager
+def span(name: str, parent: tuple[str, str] | None = None, **attrs):
+    """
+    Time a block as a span named `name`, nested under the current span (or `parent`).
+    Yields the attribute dict, so results (route, bytes, hits, ...) can be added inside.
+    """
+    parent = parent or _current.get()
+    trace_id = parent[0] if parent else secrets.token_hex(16)
+    span_id = secrets.token_hex(8)
+    token = _current.set((trace_id, span_id))
+    start_wall = time.time()
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield attrs
+    except BaseException as e:
+        status = f"error: {type(e).__name__}"
+        raise
+    finally:
+        _current.reset(token)
+        _export({
+            "trace": trace_id, "span": span_id, "parent": parent[1] if parent else None,
+            "name": name, "service": _service, "start": round(start_wall, 6),
+            "dur": round(time.perf_counter() - start, 6), "status": status, **attrs,
+        })
+
+def record(name: str, start: float, duration: float, parent: tuple[str, str] | None = None, **attrs) -> None:
+    """Export an already-finished span (e.g. from callbacks that only see start and end)."""
+    parent = parent or _current.get()
+    _export({
+        "trace": parent[0] if parent else secrets.token_hex(16), "span": secrets.token_hex(8),
+        "parent": parent[1] if parent else None, "name": name, "service": _service,
+        "start": round(start, 6), "dur": round(duration, 6), "status": attrs.pop("status", "ok"), **attrs,
+    })
+
+def current() -> tuple[str, str] | None:
+    return _current.get()
+
+def traceparent() -> str | None:
+    cur = _current.get()
+    return f"00-{cur[0]}-{cur[1]}-01" if cur else None
+
+def parse_traceparent(header: str | None) -> tuple[str, str] | None:
+    parts = (header or "").split("-")
+    if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+        return parts[1], parts[2]
+    return None
+
+def in_context(fn, *args):
+    """`fn(*args)` bound to the current span, for executor threads (which don't inherit contextvars)."""
+    ctx = contextvars.copy_context()
+    return lambda: ctx.run(fn, *args)
+
+# --- client side: propagate over streamable-http -----------------------------
+
+async def _inject(request) -> None:
+    header = traceparent()
+    if header:
+        request.headers["traceparent"] = header
+
+def http_client_factory(headers=None, timeout=None, auth=None):
+    """MCP httpx client factory that adds `traceparent` to every request made inside a span."""
+    from mcp.shared._httpx_utils import create_mcp_http_client
+
+    client = create_mcp_http_client(headers=headers, timeout=timeout, auth=auth)
+    client.event_hooks["request"].append(_inject)
+    return client
+
+def wrap_tool(tool):
+    """Client-side span around a LangChain tool's coroutine."""
+    call = tool.coroutine
+
+    async def traced_call(**arguments):
+        with span(f"tool.{tool.name}", tool=tool.name):
+            return await call(**arguments)
+
+    tool.coroutine = traced_call
+    return tool
+
+def chat_callbacks() -> list:
+    """LangChain callback recording one `llm` span per chat model call (agent turns, summarize, reformat)."""
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class ChatSpans(BaseCallbackHandler):
+        def __init__(self):
+            self.open: dict = {}
+
+        def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+            self.open[run_id] = (time.time(), time.perf_counter(), _current.get())
+
+        def _close(self, run_id, status: str, **attrs):
+            started = self.open.pop(run_id, None)
+            if started:
+                wall, t, parent = started
+                record("llm", wall, time.perf_counter() - t, parent, status=status, **attrs)
+
+        def on_llm_end(self, response, *, run_id, **kwargs):
+            usage = (response.llm_output or {}).get("token_usage") or {}
+            self._close(run_id, "ok", tokens=usage.get("total_tokens"))
+
+        def on_llm_error(self, error, *, run_id, **kwargs):
+            self._close(run_id, f"error: {type(error).__name__}")
+
+    return [ChatSpans()]
+
+# --- server side ------------------------------------------------------------
+
+def instrument(mcp, service: str) -> None:
+    """Open a `server.tool.<name>` span around every tool call, continuing the caller's trace."""
+    from mcp.server.lowlevel.server import request_ctx
+
+    set_service(service)
+    manager = mcp._tool_manager
+    call_tool = manager.call_tool
+
+    async def traced_call_tool(name, arguments, *args, **kwargs):
+        parent = None
+        with contextlib.suppress(LookupError):
+            ctx = request_ctx.get()
+            request = getattr(ctx, "request", None)
+            if request is not None and hasattr(request, "headers"):
+                parent = parse_traceparent(request.headers.get("traceparent"))
+            if parent is None and ctx.meta is not None:
+                parent = parse_traceparent(getattr(ctx.meta, "traceparent", None))
+        with span(f"server.tool.{name}", parent=parent, tool=name):
+            return await call_tool(name, arguments, *args, **kwargs)
+
+    manager.call_tool = traced_call_tool
+
+# --- reporting --------------------------------------------------------------
+
+def percentiles(values: list[float], qs=(50, 95, 99)) -> dict[str, float]:
+    """Nearest-rank percentiles, e.g. {"p50": ..., "p95": ..., "p99": ...}."""
+    ordered = sorted(values)
+    if not ordered:
+        return {f"p{q}": 0.0 for q in qs}
+    return {f"p{q}": ordered[max(0, -(-q * len(ordered) // 100) - 1)] for q in qs}
+
+def histogram(durations: dict[str, list[float]]) -> list[dict]:
+    rows = [{"name": name, "n": len(vals), **percentiles(vals), "max": max(vals)}
+            for name, vals in durations.items() if vals]
+    return sorted(rows, key=lambda r: -r["p95"])
+
+def print_histogram(rows: list[dict], title: str, out=sys.stderr, label: str = "stage") -> None:
+    if not rows:
+        return
+    print(f"== {title} ==", file=out)
+    print(f"  {label:<32}{'n':>6}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}", file=out)
+    for r in rows:
+        print(f"  {r['name']:<32}{r['n']:>6}" + "".join(f"{r[k]:>8.3f}s" for k in ("p50", "p95", "p99", "max")),
+              file=out)
+
+def report(out=sys.stderr) -> None:
+    """Per-stage latency percentiles for the spans recorded by this process (see collect_durations)."""
+    if _durations:
+        print_histogram(histogram({k: list(v) for k, v in _durations.items()}), "Latency by stage (this run)", out)
+
+def load(path: Path = TRACE_FILE, last: int | None = None) -> list[dict]:
+    """Spans from `path`, oldest first, including its rotated predecessor."""
+    lines = []
+    for p in (path.with_name(path.name + ".1"), path):
+        try:
+            lines += p.read_text(encoding="utf-8").splitlines()
+        except OSError:
+            pass
+    spans = []
+    for line in lines[-last:] if last else lines:
+        with contextlib.suppress(ValueError):
+            spans.append(json.loads(line))
+    return spans
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Latency percentiles from the trace file")
+    parser.add_argument("--file", type=Path, default=TRACE_FILE)
+    parser.add_argument("--last", type=int, help="Only the last N spans")
+    args = parser.parse_args()
+
+    spans = load(args.file, args.last)
+    by_stage: dict[str, list[float]] = {}
+    by_tool: dict[str, list[float]] = {}
+    for s in spans:
+        if s.get("tool"):
+            by_tool.setdefault(f"{s['service']}:{s['tool']}", []).append(s["dur"])
+        else:
+            by_stage.setdefault(s["name"], []).append(s["dur"])
+    print(f"{len(spans)} span(s) in {len(set(s.get('trace') for s in spans))} trace(s) from {args.file}")
+    print_histogram(histogram(by_stage), "Latency by stage", sys.stdout)
+    print_histogram(histogram(by_tool), "Latency by tool", sys.stdout, label="service:tool")
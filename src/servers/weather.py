@@ -1,45 +1,129 @@
 from mcp.server.fastmcp import FastMCP
 
 import os
-import requests
+import re
+import sys
+import asyncio
+import logging
+import httpx
+from cache import SQLiteCache
+from tracing import instrument, span
 from dotenv import load_dotenv
 load_dotenv()
 
 mcp = FastMCP("Weather")
+instrument(mcp, "weather")
 
-@mcp.tool()
-async def get_weather(location: str) -> str:
-    """Get current weather for a location using WeatherAPI.com."""
-    print(f"[Weather Tool] get_weather called with location='{location}'")
+WEATHER_URL = "http://api.weatherapi.com/v1/current.json"
+# Current conditions change slowly; serve repeated lookups from cache for a few minutes.
+WEATHER_TTL = float(os.getenv("WEATHER_TTL", "300"))
+BATCH_CONCURRENCY = 8
+
+# httpx logs full request URLs at INFO, which would include the API key
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+def _log(msg: str):
+    # stderr so the stdio transport stays usable too
+    print(f"[Weather Tool] {msg}", file=sys.stderr, flush=True)
+
+_cache = SQLiteCache("weather", WEATHER_TTL, max_entries=500)
+_http: httpx.AsyncClient | None = None
+
+def _client() -> httpx.AsyncClient:
+    # One keep-alive connection pool shared by every call, created on first use
+    global _http
+    if _http is None:
+        _http = httpx.AsyncClient(
+            timeout=httpx.Timeout(8.0),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        )
+    return _http
+
+def _normalize_location(location: str) -> str:
+    loc = re.sub(r"\s*,\s*", ",", (location or "").lower())
+    loc = re.sub(r"\s+", " ", loc)
+    return loc.strip(" .?!")
+
+def _format(data: dict) -> str:
+    loc = data.get("location", {})
+    curr = data.get("current", {})
+    name = f"{loc.get('name')}, {loc.get('region')}, {loc.get('country')}"
+    condition = curr.get("condition", {}).get("text", "Unknown")
+    temp_c = curr.get("temp_c")
+    feelslike_c = curr.get("feelslike_c")
+    humidity = curr.get("humidity")
+    wind_kph = curr.get("wind_kph")
+    wind_dir = curr.get("wind_dir")
+    _log(f"WeatherAPI response for '{name}': {temp_c}°C, feels like {feelslike_c}°C, {condition}, humidity {humidity}%, wind {wind_kph} km/h {wind_dir}")
+    return (
+        f"Weather in {name}:\n"
+        f"Condition: {condition}\n"
+        f"Temperature: {temp_c}°C (feels like {feelslike_c}°C)\n"
+        f"Humidity: {humidity}%\n"
+        f"Wind: {wind_kph} km/h {wind_dir}"
+    )
+
+async def _fetch_weather(location: str) -> str:
     api_key = os.getenv("WEATHER_API_KEY")
     if not api_key:
         return "Error: WEATHER_API_KEY is not set. Set it in your environment or .env file."
-    url = "http://api.weatherapi.com/v1/current.json"
+    key = _normalize_location(location)
+    cached = _cache.get(key)
+    if cached is not None:
+        _log(f"cache hit for '{key}'")
+        return cached
     params = {"key": api_key, "q": location, "aqi": "no"}
     try:
-        resp = requests.get(url, params=params, timeout=8)
+        with span("weather.api", location=key) as attrs:
+            resp = await _client().get(WEATHER_URL, params=params)
+            attrs["http_status"] = resp.status_code
         data = resp.json()
         if resp.status_code != 200 or "error" in data:
             return f"Error: {data.get('error', {}).get('message', 'Unable to fetch weather')}"
-        loc = data.get("location", {})
-        curr = data.get("current", {})
-        name = f"{loc.get('name')}, {loc.get('region')}, {loc.get('country')}"
-        condition = curr.get("condition", {}).get("text", "Unknown")
-        temp_c = curr.get("temp_c")
-        feelslike_c = curr.get("feelslike_c")
-        humidity = curr.get("humidity")
-        wind_kph = curr.get("wind_kph")
-        wind_dir = curr.get("wind_dir")
-        print(f"[Weather Tool] WeatherAPI response for '{location}': {temp_c}°C, feels like {feelslike_c}°C, {condition}, humidity {humidity}%, wind {wind_kph} km/h {wind_dir}")
-        return (
-            f"Weather in {name}:\n"
-            f"Condition: {condition}\n"
-            f"Temperature: {temp_c}°C (feels like {feelslike_c}°C)\n"
-            f"Humidity: {humidity}%\n"
-            f"Wind: {wind_kph} km/h {wind_dir}"
-        )
+        text = _format(data)
+        _cache.set(key, text)
+        return text
     except Exception as e:
         return f"Error fetching weather: {e}"
 
+@mcp.tool()
+async def get_weather(location: str) -> str:
+    """Get current weather for a location using WeatherAPI.com."""
+    _log(f"get_weather called with location='{location}'")
+    return await _fetch_weather(location)
+
+@mcp.tool()
+async def get_weather_batch(locations: list[str]) -> str:
+    """Get current weather for several locations in one call (looked up concurrently)."""
+    _log(f"get_weather_batch called with {len(locations)} location(s)")
+    # WeatherAPI's bulk endpoint is paid-plan only, so fan out over the shared pool instead.
+    # Duplicate locations (after normalization) are looked up once.
+    unique = {}
+    for loc in locations:
+        unique.setdefault(_normalize_location(loc), loc)
+    sem = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def one(loc: str) -> str:
+        async with sem:
+            return await _fetch_weather(loc)
+
+    results = await asyncio.gather(*(one(loc) for loc in unique.values()))
+    by_key = dict(zip(unique, results))
+    return "\n\n".join(by_key[_normalize_location(loc)] for loc in locations)
+
 if __name__ == "__main__":
-    mcp.run(transport="streamable-http")
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--transport", choices=["stdio", "streamable-http"], default="streamable-http")
+    parser.add_argument("--port", type=int, default=8000, help="Port for streamable-http")
+    parser.add_argument("--profile-startup", action="store_true", help="Report import times and time to MCP-ready, then exit")
+    args = parser.parse_args()
+
+    if args.profile_startup:
+        from startup import profile_startup
+        profile_startup(__file__)
+        raise SystemExit(0)
+
+    mcp.settings.port = args.port
+    mcp.run(transport=args.transport)
@@ -0,0 +1,156 @@
+"""
+Multi-turn chat sessions with a bounded prompt.
+
+A session keeps the latest turns verbatim and folds older ones into a running
+summary, so the history sent with each message stays under SESSION_TOKEN_BUDGET
+however long the conversation gets. Tool outputs kept with a turn are truncated.
+Folding runs in the background after a turn is answered and is awaited before the
+next one. Sessions live in the local SQLite cache (`MCP_CACHE_DIR`) and expire
+after SESSION_TTL seconds without use.
+"""
+import asyncio
+import os
+import sys
+from dataclasses import asdict, dataclass, field
+
+from servers import tracing
+from servers.cache import SQLiteCache
+
+SESSION_TTL = float(os.getenv("SESSION_TTL", str(30 * 24 * 60 * 60)))
+# Estimated tokens of history (summary + verbatim turns) sent with each message
+SESSION_TOKEN_BUDGET = int(os.getenv("SESSION_TOKEN_BUDGET", "2500"))
+SUMMARY_TOKENS = int(os.getenv("SESSION_SUMMARY_TOKENS", "400"))
+TOOL_OUTPUT_CHARS = int(os.getenv("SESSION_TOOL_OUTPUT_CHARS", "1200"))
+MAX_TOOL_OUTPUTS = 2  # per turn, most recent kept
+ANSWER_CHARS = 3000   # so one long answer can't take the whole window
+
+_store: SQLiteCache | None = None
+
+def _tokens(text: str) -> int:
+    # ~4 chars per token plus per-message overhead, like scheduler.estimate_tokens
+    return len(text) // 4 + 4
+
+def _truncate(text: str, limit: int) -> str:
+    text = text.strip()
+    return text if len(text) <= limit else text[:limit].rstrip() + " …[truncated]"
+
+def _sessions() -> SQLiteCache:
+    global _store
+    if _store is None:
+        _store = SQLiteCache("sessions", SESSION_TTL, max_entries=500)
+    return _store
+
+@dataclass
+class Turn:
+    user: str
+    assistant: str
+    tools: list[str] = field(default_factory=list)  # truncated tool outputs behind the answer
+
+    def messages(self) -> list[dict]:
+        answer = self.assistant
+        if self.tools:
+            answer += "\n\n[Tool output used for this answer]\n" + "\n---\n".join(self.tools)
+        return [{"role": "user", "content": self.user}, {"role": "assistant", "content": answer}]
+
+    def tokens(self) -> int:
+        return sum(_tokens(m["content"]) for m in self.messages())
+
+@dataclass
+class Session:
+    id: str
+    summary: str = ""
+    turns: list[Turn] = field(default_factory=list)
+    folded: int = 0  # turns folded into the summary so far
+
+    def __post_init__(self):
+        self._folding: asyncio.Task | None = None
+        self.history_tokens: list[int] = []  # per message answered in this process, for report()
+
+    @classmethod
+    def load(cls, session_id: str) -> "Session":
+        """The stored session `session_id`, or a new empty one."""
+        data = _sessions().get(session_id)
+        if not data:
+            return cls(session_id)
+        return cls(session_id, data["summary"], [Turn(**t) for t in data["turns"]], data.get("folded", 0))
+
+    def save(self) -> None:
+        data = asdict(self)
+        data.pop("id")
+        _sessions().set(self.id, data)
+
+    def clear(self) -> None:
+        self.summary, self.turns, self.folded = "", [], 0
+        self.save()
+
+    async def ready(self) -> None:
+        """Wait for a background fold from the previous turn."""
+        if self._folding is not None:
+            await self._folding
+            self._folding = None
+
+    def tokens(self) -> int:
+        return (_tokens(self.summary) if self.summary else 0) + sum(t.tokens() for t in self.turns)
+
+    def messages(self) -> list[dict]:
+        """Verbatim recent turns as chat messages (the summary goes into the system prompt)."""
+        self.history_tokens.append(self.tokens())
+        return [m for t in self.turns for m in t.messages()]
+
+    def add(self, user: str, answer, tool_outputs: list[str] | None = None, model=None) -> None:
+        """
+        Record a turn and save. If the window is over budget, the oldest turns are folded
+        into the summary in the background (with `model`, or extractively without one).
+        """
+        tools = [_truncate(str(t), TOOL_OUTPUT_CHARS) for t in (tool_outputs or [])[-MAX_TOOL_OUTPUTS:] if str(t).strip()]
+        self.turns.append(Turn(user.strip(), _truncate(str(answer or ""), ANSWER_CHARS), tools))
+        self.save()
+        # Turns stay in place (and in the saved copy) until the fold has replaced them,
+        # so a crash mid-fold loses nothing. The latest turn is always kept verbatim.
+        n, size = 0, sum(t.tokens() for t in self.turns)
+        while n < len(self.turns) - 1 and size > SESSION_TOKEN_BUDGET - SUMMARY_TOKENS:
+            size -= self.turns[n].tokens()
+            n += 1
+        if n:
+            self._folding = asyncio.ensure_future(self._fold(self.turns[:n], model))
+
+    async def _fold(self, old: list[Turn], model) -> None:
+        with tracing.span("session.fold", turns=len(old)) as attrs:
+            summary = None
+            if model is not None:
+                try:
+                    summary = await _summarize_turns(model, self.summary, old)
+                except Exception as e:
+                    print("Session summary failed, folding extractively:", e, file=sys.stderr)
+            attrs["model"] = summary is not None
+            if not summary:
+                notes = [f"User asked: {_truncate(t.user, 200)} Answer: {_truncate(t.assistant, 300)}" for t in old]
+                summary = " ".join([self.summary, *notes]).strip()
+                # Over the cap, the oldest notes are dropped first
+                summary = summary[-SUMMARY_TOKENS * 4:]
+            self.summary = _truncate(summary, SUMMARY_TOKENS * 4)
+            self.turns = self.turns[len(old):]
+            self.folded += len(old)
+            self.save()
+
+    def report(self) -> None:
+        if not self.history_tokens:
+            return
+        print(f"Session {self.id}: {len(self.turns)} recent turn(s) kept, {self.folded} folded into the summary; "
+              f"history ~{sum(self.history_tokens) // len(self.history_tokens)} tokens per message "
+              f"(max {max(self.history_tokens)}, budget {SESSION_TOKEN_BUDGET})", file=sys.stderr)
+
+async def _summarize_turns(model, summary: str, turns: list[Turn]) -> str:
+    """Update the running summary with `turns` (a single short model call)."""
+    from langchain_core.messages import HumanMessage, SystemMessage
+
+    transcript = "\n".join(f"User: {t.user}\nAssistant: {_truncate(t.assistant, 1200)}" for t in turns)
+    res = await model.ainvoke([
+        SystemMessage(content=(
+            f"Update the running summary of a conversation in at most {SUMMARY_TOKENS * 3 // 4} words. "
+            "Keep facts, numbers, names, locations and open questions the user may refer back to; drop small talk. "
+            "Reply with the summary only."
+        )),
+        HumanMessage(content=f"Current summary:\n{summary or '(none)'}\n\nNew turns:\n{transcript}"),
+    ])
+    return (res.content or "").strip()